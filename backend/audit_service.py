@@ -0,0 +1,202 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogBuffer:
+    """
+    Buffers audit log records in memory and writes them with insert_many from a
+    background task, every flush_interval_seconds or as soon as flush_size records
+    are waiting. Callers of add() never wait on the database.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        flush_size: int = 100,
+        flush_interval_seconds: float = 1.0,
+        max_buffer_size: int = 100000
+    ):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer_size = max_buffer_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_total = 0
+        self.failed_flushes = 0
+        self.dropped_total = 0
+        self.last_flush_at: Optional[str] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._buffer)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "flushed_total": self.flushed_total,
+            "failed_flushes": self.failed_flushes,
+            "dropped_total": self.dropped_total,
+            "last_flush_at": self.last_flush_at,
+            "flush_size": self.flush_size,
+            "flush_interval_seconds": self.flush_interval_seconds
+        }
+
+    async def add(self, record: Dict[str, Any]):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_size:
+            if self._task is None:
+                # No background flusher running (not started, or already stopped)
+                await self.flush()
+            else:
+                self._flush_requested.set()
+
+    async def flush(self):
+        """Write everything buffered so far; failed records are kept for the next flush"""
+        async with self._lock:
+            if not self._buffer:
+                return
+
+            records, self._buffer = self._buffer, []
+            try:
+                await self.db.audit_logs.insert_many(records, ordered=False)
+                self.flushed_total += len(records)
+            except BulkWriteError as e:
+                # Duplicate keys were already written by an earlier partial flush; retry the rest
+                retry = [records[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                self.flushed_total += e.details.get("nInserted", 0)
+                self.failed_flushes += 1
+                logger.error(f"Audit log flush partially failed, {len(retry)} records requeued: {e}")
+                self._requeue(retry)
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Audit log flush failed, {len(records)} records requeued: {e}")
+                self._requeue(records)
+
+            self.last_flush_at = datetime.now(timezone.utc).isoformat()
+
+    def _requeue(self, records: List[Dict[str, Any]]):
+        room = self.max_buffer_size - len(self._buffer)
+        if len(records) > room:
+            self.dropped_total += len(records) - max(room, 0)
+            logger.error(f"Audit buffer full, dropping {len(records) - max(room, 0)} records")
+            records = records[:max(room, 0)]
+        self._buffer = records + self._buffer
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer and flush whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+
+            failed_flushes = self.failed_flushes
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Audit log flush loop error: {e}")
+            if self.failed_flushes != failed_flushes:
+                # Requeued records keep the buffer over flush_size; wait out the interval
+                # instead of retrying on every add while the database is unavailable
+                await asyncio.sleep(self.flush_interval_seconds)
+
+
+class AuditLogService:
+    """Audit log indexes and monthly rollover into archive collections"""
+
+    ARCHIVE_PREFIX = "audit_logs_"
+
+    # id is the pagination tie-breaker, so it is part of every sort index
+    INDEXES = [
+        ([("timestamp", DESCENDING), ("id", DESCENDING)], "timestamp_id"),
+        ([("resource_type", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], "resource_type_timestamp"),
+        ([("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], "user_id_timestamp"),
+    ]
+
+    @staticmethod
+    def archive_collection_name(month: str) -> str:
+        """'2025-01' -> 'audit_logs_2025_01'"""
+        if not re.fullmatch(r"\d{4}-\d{2}", month):
+            raise ValueError(f"Invalid month: {month} (expected YYYY-MM)")
+        return AuditLogService.ARCHIVE_PREFIX + month.replace("-", "_")
+
+    @staticmethod
+    async def ensure_indexes(collection: AsyncIOMotorCollection):
+        for keys, name in AuditLogService.INDEXES:
+            await collection.create_index(keys, name=name)
+
+    @staticmethod
+    async def list_archives(db: AsyncIOMotorDatabase) -> List[str]:
+        names = await db.list_collection_names()
+        return sorted(
+            name[len(AuditLogService.ARCHIVE_PREFIX):].replace("_", "-")
+            for name in names
+            if re.fullmatch(AuditLogService.ARCHIVE_PREFIX + r"\d{4}_\d{2}", name)
+        )
+
+    @staticmethod
+    async def rollover(db: AsyncIOMotorDatabase, keep_months: int = 3) -> Dict[str, Any]:
+        """
+        Move audit logs older than the last `keep_months` calendar months
+        into one audit_logs_YYYY_MM collection per month
+        """
+        now = datetime.now(timezone.utc)
+        year, month = now.year, now.month - keep_months
+        while month < 1:
+            month += 12
+            year -= 1
+        cutoff = f"{year:04d}-{month:02d}"
+
+        months = await db.audit_logs.aggregate([
+            {"$match": {"timestamp": {"$lt": cutoff}}},
+            {"$group": {"_id": {"$substrCP": ["$timestamp", 0, 7]}}},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+
+        archived = {}
+        for entry in months:
+            bucket = entry["_id"]
+            start, end = AuditLogService._month_bounds(bucket)
+            archive_name = AuditLogService.archive_collection_name(bucket)
+            month_query = {"timestamp": {"$gte": start, "$lt": end}}
+
+            # $merge is idempotent on _id, so a rollover interrupted before the delete can simply be rerun
+            await db.audit_logs.aggregate([
+                {"$match": month_query},
+                {"$merge": {"into": archive_name, "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+            ]).to_list(None)
+            await AuditLogService.ensure_indexes(db[archive_name])
+
+            result = await db.audit_logs.delete_many(month_query)
+            archived[bucket] = result.deleted_count
+            logger.info(f"Rolled over {result.deleted_count} audit logs into {archive_name}")
+
+        return {"cutoff": cutoff, "archived": archived}
+
+    @staticmethod
+    def _month_bounds(month: str):
+        year, mon = (int(part) for part in month.split("-"))
+        next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+        return month, f"{next_year:04d}-{next_mon:02d}"
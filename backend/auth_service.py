@@ -0,0 +1,84 @@
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import logging
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class OAuthSessionClient:
+    """Async, pooled client for the Emergent OAuth session-data endpoint"""
+
+    def __init__(
+        self,
+        session_data_url: str,
+        timeout: float = 5.0,
+        max_retries: int = 2,
+        cache_ttl_seconds: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.session_data_url = session_data_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        # session_id -> (fetched_at, session data)
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+                transport=self._transport
+            )
+        return self._client
+
+    async def get_session_data(self, session_id: str) -> Dict[str, Any]:
+        """
+        Exchange an OAuth session_id for user/session data.
+        Retries transport errors and 5xx responses with a short backoff;
+        4xx responses are raised immediately.
+        """
+        cached = self._cache.get(session_id)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl_seconds:
+            return cached[1]
+
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._get_client().get(
+                    self.session_data_url,
+                    headers={"X-Session-ID": session_id}
+                )
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    data = response.json()
+                    self._store(session_id, data)
+                    return data
+                last_error = httpx.HTTPStatusError(
+                    f"Server error {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                last_error = e
+
+            if attempt < self.max_retries:
+                logger.warning(f"OAuth session-data attempt {attempt + 1} failed: {last_error}")
+                await asyncio.sleep(0.2 * (2 ** attempt))
+
+        raise last_error
+
+    def _store(self, session_id: str, data: Dict[str, Any]):
+        now = time.monotonic()
+        # Drop expired entries so the cache cannot grow without bound
+        expired = [key for key, (fetched_at, _) in self._cache.items() if now - fetched_at >= self.cache_ttl_seconds]
+        for key in expired:
+            del self._cache[key]
+        self._cache[session_id] = (now, data)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
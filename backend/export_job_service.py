@@ -0,0 +1,257 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+import asyncio
+import logging
+import os
+import re
+import uuid
+
+from export_service import ExportService, ExportRequest
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJobLimitError(Exception):
+    """Raised when a user already has the maximum number of active export jobs"""
+
+
+class ExportJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    entity: str
+    format: str
+    filters: Optional[Dict[str, Any]] = None
+    status: str = "queued"  # queued, running, completed, failed, expired
+    rows_total: Optional[int] = None
+    rows_written: int = 0
+    file_name: Optional[str] = None
+    size_bytes: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    expires_at: Optional[str] = None
+
+
+class ExportJobManager:
+    """
+    Runs exports in the background on a bounded worker pool and keeps the
+    finished artifacts on local disk until they expire. Job state lives in the
+    export_jobs collection; the queue itself is in-process (single API instance).
+    """
+
+    ACTIVE_STATUSES = ["queued", "running"]
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        artifact_dir: str,
+        workers: int = 2,
+        max_active_per_user: int = 2,
+        artifact_ttl_seconds: float = 86400,
+        cleanup_interval_seconds: float = 600,
+        max_queue_size: int = 1000
+    ):
+        self.db = db
+        self.artifact_dir = artifact_dir
+        self.workers = workers
+        self.max_active_per_user = max_active_per_user
+        self.artifact_ttl_seconds = artifact_ttl_seconds
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def artifact_path(self, job: Dict[str, Any]) -> str:
+        return os.path.join(self.artifact_dir, f"{job['id']}.{ExportService.FILE_EXTENSIONS[job['format']]}")
+
+    async def submit(self, request: ExportRequest, user_id: str) -> Dict[str, Any]:
+        """Validate and queue an export; raises ValueError for bad requests and ExportJobLimitError when over the limit"""
+        ExportService.validate_request(request.entity, request.filters)
+        if request.format not in ExportService.FILE_EXTENSIONS:
+            raise ValueError(f"Unsupported export format: {request.format}")
+
+        active = await self.db.export_jobs.count_documents({
+            "user_id": user_id,
+            "status": {"$in": self.ACTIVE_STATUSES}
+        })
+        if active >= self.max_active_per_user:
+            raise ExportJobLimitError(f"At most {self.max_active_per_user} export jobs may be active at once")
+        if self._queue.full():
+            raise ExportJobLimitError("Export queue is full, try again later")
+
+        job = ExportJob(user_id=user_id, entity=request.entity, format=request.format, filters=request.filters)
+        await self.db.export_jobs.insert_one(job.model_dump())
+        self._queue.put_nowait(job.id)
+        return job.model_dump()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+
+    def start(self):
+        if self._tasks:
+            return
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+
+    async def stop(self):
+        """Cancel the workers; jobs still running are picked up again by requeue_pending on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def requeue_pending(self) -> int:
+        """Queue jobs left queued or running by a previous process (oldest first)"""
+        await self.db.export_jobs.update_many(
+            {"status": "running"},
+            {"$set": {"status": "queued", "rows_written": 0, "started_at": None}}
+        )
+        count = 0
+        async for job in self.db.export_jobs.find({"status": "queued"}, {"_id": 0, "id": 1}).sort("created_at", 1):
+            try:
+                self._queue.put_nowait(job["id"])
+                count += 1
+            except asyncio.QueueFull:
+                logger.error(f"Export queue full, job {job['id']} left queued")
+                break
+        if count:
+            logger.info(f"Requeued {count} export jobs")
+        return count
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Export job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = await self.db.export_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "started_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0}
+        )
+        if not job:
+            return
+
+        path = self.artifact_path(job)
+        partial_path = path + ".part"
+
+        async def on_batch(rows: int):
+            await self.db.export_jobs.update_one({"id": job_id}, {"$inc": {"rows_written": rows}})
+
+        try:
+            rows_total = await self.db[job["entity"]].count_documents(job.get("filters") or {})
+            await self.db.export_jobs.update_one({"id": job_id}, {"$set": {"rows_total": rows_total}})
+
+            if job["format"] == "excel":
+                await ExportService.write_excel(self.db, job["entity"], job.get("filters"), partial_path, on_batch=on_batch)
+            else:
+                streams = {
+                    "csv": ExportService.stream_csv,
+                    "json": ExportService.stream_json,
+                    "ndjson": ExportService.stream_ndjson
+                }
+                with open(partial_path, "wb") as f:
+                    async for chunk in streams[job["format"]](self.db, job["entity"], job.get("filters"), on_batch=on_batch):
+                        await asyncio.to_thread(f.write, chunk)
+
+            # The artifact only appears under its final name once complete
+            os.replace(partial_path, path)
+        except Exception as e:
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+            logger.error(f"Export job {job_id} failed: {e}")
+            await self.db.export_jobs.update_one({"id": job_id}, {"$set": {
+                "status": "failed",
+                "error": str(e),
+                "finished_at": datetime.now(timezone.utc).isoformat()
+            }})
+            return
+
+        finished_at = datetime.now(timezone.utc)
+        timestamp = datetime.fromisoformat(job["created_at"]).strftime('%Y%m%d_%H%M%S')
+        await self.db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "completed",
+            "file_name": f"{job['entity']}_{timestamp}.{ExportService.FILE_EXTENSIONS[job['format']]}",
+            "size_bytes": os.path.getsize(path),
+            "finished_at": finished_at.isoformat(),
+            "expires_at": (finished_at + timedelta(seconds=self.artifact_ttl_seconds)).isoformat()
+        }})
+        logger.info(f"Export job {job_id} completed: {job['entity']} as {job['format']}")
+
+    async def cleanup_expired(self) -> int:
+        """Delete artifacts past their TTL and mark their jobs expired"""
+        now = datetime.now(timezone.utc).isoformat()
+        expired = 0
+        async for job in self.db.export_jobs.find(
+            {"status": "completed", "expires_at": {"$lte": now}},
+            {"_id": 0, "id": 1, "format": 1}
+        ):
+            path = self.artifact_path(job)
+            if os.path.exists(path):
+                os.unlink(path)
+            await self.db.export_jobs.update_one({"id": job["id"]}, {"$set": {"status": "expired"}})
+            expired += 1
+        if expired:
+            logger.info(f"Removed {expired} expired export artifacts")
+        return expired
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                await self.cleanup_expired()
+            except Exception as e:
+                logger.error(f"Export artifact cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval_seconds)
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range 'bytes=start-end' header into inclusive offsets.
+    Returns None when there is no usable Range header (serve the whole file)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not match or (not match.group(1) and not match.group(2)):
+        return None  # multi-range or malformed: ignored as RFC 9110 allows
+
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        if start > end:
+            return None  # invalid byte-range-spec (e.g. bytes=5-2): ignored like a malformed header
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+
+    if start >= size:
+        raise ValueError(f"Range not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
+
+
+async def iter_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Yield bytes start..end (inclusive) of a file, reading off the event loop"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
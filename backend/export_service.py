@@ -1,19 +1,36 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, BinaryIO, Iterator, Type
 from datetime import datetime, timezone
-import pandas as pd
 import io
 import csv
+import codecs
 import json
+import asyncio
 import logging
-from pydantic import BaseModel
+import tempfile
+import itertools
+import zipfile
+import gzip
+import hashlib
+from bson import json_util
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.exceptions import InvalidFileException
+from pymongo import InsertOne, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from pydantic import BaseModel, ValidationError
 import os
 
+from audit_service import AuditLogService
+from index_service import IndexService
+
 logger = logging.getLogger(__name__)
 
 export_router = APIRouter(prefix="/api/export")
 
+ProgressCallback = Callable[[int], Awaitable[None]]
+
 
 class ExportRequest(BaseModel):
     entity: str  # products, boms, inventory, etc.
@@ -38,81 +55,473 @@ class ExportService:
         "attendance", "payroll"
     ]
     
+    EXPORT_BATCH_SIZE = 1000
+    
+    # 1,048,576 rows per worksheet, header included
+    EXCEL_MAX_ROWS = 1048576
+    
+    # Server-side JavaScript operators are never accepted in client-supplied filters
+    FORBIDDEN_OPERATORS = {"$where", "$function", "$accumulator"}
+    
+    MEDIA_TYPES = {
+        "csv": "text/csv",
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+        "excel": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    }
+    
+    FILE_EXTENSIONS = {"csv": "csv", "json": "json", "ndjson": "ndjson", "excel": "xlsx"}
+    
     @staticmethod
-    async def export_to_csv(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> bytes:
-        """Export entity to CSV format"""
+    def validate_request(entity: str, filters: Dict = None):
+        """Raise ValueError for unsupported entities or unsafe filters (call before streaming starts)"""
         if entity not in ExportService.SUPPORTED_ENTITIES:
             raise ValueError(f"Entity {entity} not supported for export")
         
-        # Get data from MongoDB
-        query = filters or {}
-        data = await db[entity].find(query, {"_id": 0}).to_list(10000)
+        def check(value):
+            if isinstance(value, dict):
+                for key, nested in value.items():
+                    if key in ExportService.FORBIDDEN_OPERATORS:
+                        raise ValueError(f"Operator {key} not allowed in export filters")
+                    check(nested)
+            elif isinstance(value, list):
+                for nested in value:
+                    check(nested)
         
-        if not data:
-            # Return empty CSV with headers
-            return b"No data found"
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
+        check(filters or {})
+    
+    @staticmethod
+    async def iter_batches(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None,
+                           batch_size: int = EXPORT_BATCH_SIZE,
+                           on_batch: Optional[ProgressCallback] = None) -> AsyncIterator[List[Dict]]:
+        """Iterate the whole result set in lists of batch_size documents (on_batch receives each batch length)"""
+        ExportService.validate_request(entity, filters)
         
-        # Convert to CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, encoding='utf-8-sig')  # BOM for Excel compatibility
-        return output.getvalue().encode('utf-8-sig')
+        cursor = db[entity].find(filters or {}, {"_id": 0}).batch_size(batch_size)
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                if on_batch:
+                    await on_batch(len(batch))
+                batch = []
+        if batch:
+            yield batch
+            if on_batch:
+                await on_batch(len(batch))
     
     @staticmethod
-    async def export_to_excel(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> bytes:
-        """Export entity to Excel format"""
-        if entity not in ExportService.SUPPORTED_ENTITIES:
-            raise ValueError(f"Entity {entity} not supported for export")
+    async def collect_fieldnames(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> List[str]:
+        """
+        Union of the top-level keys of every matching document, computed server-side so
+        a field that only appears late in the result set still gets a column. Keys are
+        ordered by the earliest position they take in any document, then by name.
+        """
+        ExportService.validate_request(entity, filters)
         
-        query = filters or {}
-        data = await db[entity].find(query, {"_id": 0}).to_list(10000)
+        pipeline = [
+            {"$match": filters or {}},
+            {"$project": {"_id": 0}},
+            {"$project": {"keys": {"$map": {"input": {"$objectToArray": "$$ROOT"}, "as": "field", "in": "$$field.k"}}}},
+            {"$unwind": {"path": "$keys", "includeArrayIndex": "position"}},
+            {"$group": {"_id": "$keys", "position": {"$min": "$position"}}},
+            {"$sort": {"position": 1, "_id": 1}}
+        ]
+        keys = await db[entity].aggregate(pipeline, allowDiskUse=True).to_list(None)
+        return [key["_id"] for key in keys]
+    
+    @staticmethod
+    def _csv_value(value):
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value
+    
+    @staticmethod
+    async def stream_csv(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None,
+                         on_batch: Optional[ProgressCallback] = None) -> AsyncIterator[bytes]:
+        """
+        Stream CSV one batch at a time. The header is the union of keys across the
+        whole result set (see collect_fieldnames), so no field is dropped.
+        """
+        fieldnames = await ExportService.collect_fieldnames(db, entity, filters)
+        if not fieldnames:
+            yield b"No data found"
+            return
         
-        if not data:
-            raise ValueError("No data to export")
+        # BOM for Excel compatibility
+        prefix = codecs.BOM_UTF8
+        header = True
+        async for batch in ExportService.iter_batches(db, entity, filters, on_batch=on_batch):
+            output = io.StringIO()
+            # Keys added between the two passes are ignored rather than failing the stream midway
+            writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
+            if header:
+                writer.writeheader()
+                header = False
+            writer.writerows(
+                {key: ExportService._csv_value(value) for key, value in doc.items()}
+                for doc in batch
+            )
+            yield prefix + output.getvalue().encode('utf-8')
+            prefix = b""
+    
+    @staticmethod
+    async def stream_ndjson(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None,
+                            on_batch: Optional[ProgressCallback] = None) -> AsyncIterator[bytes]:
+        """Stream one JSON document per line"""
+        async for batch in ExportService.iter_batches(db, entity, filters, on_batch=on_batch):
+            lines = [json.dumps(doc, ensure_ascii=False, default=str) for doc in batch]
+            yield ("\n".join(lines) + "\n").encode('utf-8')
+    
+    @staticmethod
+    async def stream_json(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None,
+                          on_batch: Optional[ProgressCallback] = None) -> AsyncIterator[bytes]:
+        """Stream a single JSON array without building it in memory"""
+        yield b"["
+        first = True
+        async for batch in ExportService.iter_batches(db, entity, filters, on_batch=on_batch):
+            items = ",\n".join(json.dumps(doc, ensure_ascii=False, default=str) for doc in batch)
+            yield (("\n" if first else ",\n") + items).encode('utf-8')
+            first = False
+        yield b"\n]"
+    
+    @staticmethod
+    async def export_to_csv(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> bytes:
+        """Export entity to CSV format"""
+        return b"".join([chunk async for chunk in ExportService.stream_csv(db, entity, filters)])
+    
+    @staticmethod
+    def _excel_value(value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        # openpyxl rejects control characters and timezone-aware datetimes
+        return ILLEGAL_CHARACTERS_RE.sub("", str(value))
+    
+    @staticmethod
+    async def write_excel(db: AsyncIOMotorDatabase, entity: str, filters: Dict, path: str,
+                          on_batch: Optional[ProgressCallback] = None) -> int:
+        """
+        Write an XLSX file with openpyxl's write-only workbook, appending rows as the
+        cursor yields them (rows are spooled to disk, not kept in memory). A new sheet
+        is started whenever the Excel row limit is reached. Returns the rows written.
+        """
+        # Columns are the union of keys across all documents (see collect_fieldnames)
+        fieldnames = await ExportService.collect_fieldnames(db, entity, filters)
+        workbook = Workbook(write_only=True)
+        sheet = None
+        sheet_rows = 0
+        sheet_count = 0
+        total = 0
         
-        df = pd.DataFrame(data)
+        async for batch in ExportService.iter_batches(db, entity, filters, on_batch=on_batch):
+            for doc in batch:
+                if sheet is None or sheet_rows >= ExportService.EXCEL_MAX_ROWS:
+                    sheet_count += 1
+                    title = entity[:31] if sheet_count == 1 else f"{entity[:25]}_{sheet_count}"
+                    sheet = workbook.create_sheet(title=title)
+                    sheet.append(fieldnames)
+                    sheet_rows = 1
+                
+                sheet.append([ExportService._excel_value(doc.get(field)) for field in fieldnames])
+                sheet_rows += 1
+                total += 1
         
-        # Convert to Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name=entity, index=False)
+        if total == 0:
+            raise ValueError("No data to export")
         
-        return output.getvalue()
+        # Zipping the workbook is blocking file I/O
+        await asyncio.to_thread(workbook.save, path)
+        return total
+    
+    @staticmethod
+    async def export_to_excel_file(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> str:
+        """Export entity to a temporary XLSX file and return its path (caller deletes it)"""
+        fd, path = tempfile.mkstemp(suffix=".xlsx", dir=os.environ.get("EXPORT_TMP_DIR"))
+        os.close(fd)
+        try:
+            await ExportService.write_excel(db, entity, filters, path)
+        except Exception:
+            os.unlink(path)
+            raise
+        return path
+    
+    @staticmethod
+    async def export_to_excel(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> bytes:
+        """Export entity to Excel format"""
+        path = await ExportService.export_to_excel_file(db, entity, filters)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.unlink(path)
     
     @staticmethod
     async def export_to_json(db: AsyncIOMotorDatabase, entity: str, filters: Dict = None) -> bytes:
         """Export entity to JSON format"""
-        if entity not in ExportService.SUPPORTED_ENTITIES:
-            raise ValueError(f"Entity {entity} not supported for export")
-        
-        query = filters or {}
-        data = await db[entity].find(query, {"_id": 0}).to_list(10000)
-        
-        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        return b"".join([chunk async for chunk in ExportService.stream_json(db, entity, filters)])
 
 
 class ImportService:
     """Handles data import from multiple formats"""
     
+    IMPORT_BATCH_SIZE = 1000
+    
+    IMPORT_FORMATS = {".csv": "csv", ".xlsx": "excel", ".xlsm": "excel"}
+    
+    @staticmethod
+    async def _write_batch(db: AsyncIOMotorDatabase, entity: str, operations: List) -> tuple:
+        """One unordered bulk_write; returns (matched, upserted + inserted, writeErrors)"""
+        try:
+            result = await db[entity].bulk_write(operations, ordered=False)
+            return result.matched_count, result.upserted_count + result.inserted_count, []
+        except BulkWriteError as e:
+            return (
+                e.details.get("nMatched", 0),
+                e.details.get("nUpserted", 0) + e.details.get("nInserted", 0),
+                e.details.get("writeErrors", [])
+            )
+    
+    @staticmethod
+    def detect_format(filename: str) -> str:
+        extension = os.path.splitext(filename or "")[1].lower()
+        if extension not in ImportService.IMPORT_FORMATS:
+            raise ValueError(f"Unsupported import file type: {extension or filename}")
+        return ImportService.IMPORT_FORMATS[extension]
+    
+    @staticmethod
+    def _iter_csv_rows(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Read CSV rows lazily from a binary file object (BOM tolerated)"""
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            yield from csv.DictReader(text)
+        finally:
+            text.detach()
+    
+    @staticmethod
+    def _iter_excel_rows(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Read rows from every sheet of a workbook in read-only mode (first row of each sheet is the header)"""
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                header = next(rows, None)
+                if not header:
+                    continue
+                header = [str(name).strip() if name is not None else "" for name in header]
+                for values in rows:
+                    if all(value is None for value in values):
+                        continue
+                    yield {name: value for name, value in zip(header, values) if name}
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _prepare_row(row: Dict[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+        """
+        Drop blank cells (so model defaults apply), turn Excel numbers/dates in text
+        fields back into text and decode JSON-encoded nested values written by exports
+        """
+        cleaned = {}
+        for key, value in row.items():
+            if key is None:
+                continue  # CSV line with more cells than headers
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            field = model.model_fields.get(key)
+            text_field = field is not None and field.annotation in (str, Optional[str])
+            if text_field and not isinstance(value, str):
+                value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+            elif isinstance(value, str) and value[:1] in "[{" and field is not None and not text_field:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            cleaned[key] = value
+        return cleaned
+    
+    @staticmethod
+    def _format_validation_error(error: ValidationError) -> str:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+            for item in error.errors()
+        )
+    
+    @staticmethod
+    async def import_stream(db: AsyncIOMotorDatabase, entity: str, stream: BinaryIO, file_format: str,
+                            model: Type[BaseModel], mode: str, error_path: str,
+                            batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Stream rows from a CSV or Excel file, validate each one against `model` and write
+        valid rows in batches (append: insert, update: upsert by id). Rejected rows,
+        whether by validation or by the database, go to a CSV error report at error_path
+        instead of aborting the import. Rows are numbered from 1, excluding headers.
+        A file that cannot be parsed stops the import with `error` set in the summary.
+        """
+        if mode not in ("append", "update"):
+            raise ValueError(f"Unsupported import mode: {mode}")
+        rows = ImportService._iter_csv_rows(stream) if file_format == "csv" else ImportService._iter_excel_rows(stream)
+        
+        summary = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0, "batches": 0}
+        error_file = None
+        error_writer = None
+        
+        def write_errors(failures: List[tuple]):
+            nonlocal error_file, error_writer
+            if error_file is None:
+                error_file = open(error_path, "w", encoding="utf-8", newline="")
+                error_writer = csv.writer(error_file)
+                error_writer.writerow(["row", "error", "data"])
+            error_writer.writerows(
+                [number, message, json.dumps(row, ensure_ascii=False, default=str)]
+                for number, message, row in failures
+            )
+        
+        try:
+            while True:
+                # Parsing is blocking (file reads, openpyxl), so each chunk is pulled in a worker thread
+                try:
+                    chunk = await asyncio.to_thread(lambda: list(itertools.islice(rows, batch_size)))
+                except (ValueError, csv.Error, zipfile.BadZipFile, InvalidFileException) as e:
+                    # Rows before the unreadable part are already written; report where reading stopped
+                    summary["error"] = f"File could not be read after row {summary['rows']}: {e}"
+                    logger.error(f"Import into {entity} stopped: {summary['error']}")
+                    break
+                if not chunk:
+                    break
+                
+                operations = []
+                accepted = []
+                failures = []
+                for row in chunk:
+                    summary["rows"] += 1
+                    number = summary["rows"]
+                    cleaned = ImportService._prepare_row(row, model)
+                    if mode == "update" and "id" not in cleaned:
+                        failures.append((number, "id: required in update mode", row))
+                        continue
+                    try:
+                        record = model.model_validate(cleaned)
+                    except ValidationError as e:
+                        failures.append((number, ImportService._format_validation_error(e), row))
+                        continue
+                    
+                    if mode == "update":
+                        # Columns in the file overwrite; model defaults (created_at, ...) only fill new documents
+                        provided = record.model_dump(exclude_unset=True)
+                        defaults = {k: v for k, v in record.model_dump().items() if k not in provided}
+                        update = {"$set": provided}
+                        if defaults:
+                            update["$setOnInsert"] = defaults
+                        operations.append(UpdateOne({"id": record.id}, update, upsert=True))
+                    else:
+                        operations.append(InsertOne(record.model_dump()))
+                    accepted.append((number, row))
+                
+                if operations:
+                    matched, written, rejected = await ImportService._write_batch(db, entity, operations)
+                    summary["batches"] += 1
+                    summary["updated"] += matched
+                    summary["inserted"] += written
+                    for err in rejected:
+                        number, row = accepted[err["index"]]
+                        message = "duplicate key" if err.get("code") == 11000 else err.get("errmsg", "write failed")
+                        failures.append((number, message, row))
+                
+                if failures:
+                    summary["failed"] += len(failures)
+                    await asyncio.to_thread(write_errors, sorted(failures, key=lambda failure: failure[0]))
+        finally:
+            if error_file is not None:
+                error_file.close()
+        
+        summary["has_error_report"] = error_file is not None
+        logger.info(f"Imported {entity}: {summary['inserted']} inserted, {summary['updated']} updated, {summary['failed']} failed")
+        return summary
+    
+    @staticmethod
+    async def _bulk_upsert(db: AsyncIOMotorDatabase, entity: str, records: List[Dict],
+                           batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Upsert records by id with one unordered bulk_write per batch_size records.
+        A failing record does not stop the rest of its batch; errors are reported per batch.
+        Records without an id are skipped.
+        """
+        updated = 0
+        inserted = 0
+        skipped = 0
+        errors = []
+        operations = []
+        batch_ids = []
+        batch_number = 0
+        
+        async def send():
+            nonlocal updated, inserted, batch_number
+            batch_number += 1
+            matched, upserted, write_errors = await ImportService._write_batch(db, entity, operations)
+            updated += matched
+            inserted += upserted
+            if write_errors:
+                errors.append({
+                    "batch": batch_number,
+                    "failed": len(write_errors),
+                    "records": [
+                        {"id": batch_ids[err["index"]], "code": err.get("code"), "message": err.get("errmsg")}
+                        for err in write_errors
+                    ]
+                })
+                logger.error(f"Import into {entity}: batch {batch_number} had {len(write_errors)} failed records")
+        
+        for record in records:
+            if "id" not in record:
+                skipped += 1
+                continue
+            operations.append(UpdateOne({"id": record["id"]}, {"$set": record}, upsert=True))
+            batch_ids.append(record["id"])
+            if len(operations) >= batch_size:
+                await send()
+                operations, batch_ids = [], []
+        if operations:
+            await send()
+        
+        return {
+            "mode": "update",
+            "updated": updated,
+            "inserted": inserted,
+            "skipped": skipped,
+            "batches": batch_number,
+            "errors": errors
+        }
+    
+    @staticmethod
+    def _read_records(rows: Iterator[Dict[str, Any]]) -> List[Dict]:
+        """Materialize parsed rows, leaving blank cells out of each record"""
+        return [
+            {key: value for key, value in row.items()
+             if key is not None and value is not None and not (isinstance(value, str) and not value.strip())}
+            for row in rows
+        ]
+    
     @staticmethod
     async def import_from_csv(db: AsyncIOMotorDatabase, entity: str, file_content: bytes, mode: str = "append"):
         """Import data from CSV"""
-        # Parse CSV
-        csv_str = file_content.decode('utf-8-sig')
-        df = pd.read_csv(io.StringIO(csv_str))
-        
-        # Convert to list of dicts
-        records = df.to_dict('records')
+        # Parsed with the same reader as import_stream, off the event loop
+        records = await asyncio.to_thread(
+            ImportService._read_records, ImportService._iter_csv_rows(io.BytesIO(file_content))
+        )
         
         return await ImportService._import_records(db, entity, records, mode)
     
     @staticmethod
     async def import_from_excel(db: AsyncIOMotorDatabase, entity: str, file_content: bytes, mode: str = "append"):
         """Import data from Excel"""
-        df = pd.read_excel(io.BytesIO(file_content))
-        records = df.to_dict('records')
+        records = await asyncio.to_thread(
+            ImportService._read_records, ImportService._iter_excel_rows(io.BytesIO(file_content))
+        )
         
         return await ImportService._import_records(db, entity, records, mode)
     
@@ -124,7 +533,8 @@ class ImportService:
         return await ImportService._import_records(db, entity, records, mode)
     
     @staticmethod
-    async def _import_records(db: AsyncIOMotorDatabase, entity: str, records: List[Dict], mode: str):
+    async def _import_records(db: AsyncIOMotorDatabase, entity: str, records: List[Dict], mode: str,
+                              batch_size: int = IMPORT_BATCH_SIZE):
         """Import records based on mode"""
         if mode == "replace":
             # Clear collection and insert
@@ -133,21 +543,8 @@ class ImportService:
             return {"mode": "replace", "inserted": len(result.inserted_ids)}
         
         elif mode == "update":
-            # Update existing records by ID
-            updated = 0
-            inserted = 0
-            for record in records:
-                if "id" in record:
-                    result = await db[entity].update_one(
-                        {"id": record["id"]},
-                        {"$set": record},
-                        upsert=True
-                    )
-                    if result.matched_count > 0:
-                        updated += 1
-                    else:
-                        inserted += 1
-            return {"mode": "update", "updated": updated, "inserted": inserted}
+            # Upsert existing records by ID
+            return await ImportService._bulk_upsert(db, entity, records, batch_size)
         
         else:  # append
             # Add timestamps if not present
@@ -162,36 +559,70 @@ class ImportService:
 class GitHubExportService:
     """Export database schema and configuration to GitHub"""
     
+    SCHEMA_SAMPLE_SIZE = 1000
+    SCHEMA_PARALLELISM = 8
+    
+    @staticmethod
+    def _record_types(histogram: Dict[str, Dict[str, int]], path: str, value):
+        """Count the type of value at path; nested fields become "a.b", array items "a[]" """
+        type_name = type(value).__name__
+        counts = histogram.setdefault(path, {})
+        counts[type_name] = counts.get(type_name, 0) + 1
+        
+        if isinstance(value, dict):
+            for key, nested in value.items():
+                GitHubExportService._record_types(histogram, f"{path}.{key}", nested)
+        elif isinstance(value, list):
+            for item in value:
+                GitHubExportService._record_types(histogram, f"{path}[]", item)
+    
+    @staticmethod
+    async def _collection_schema(db: AsyncIOMotorDatabase, collection_name: str) -> Optional[Dict[str, Any]]:
+        """Infer a collection's fields from a random sample of documents"""
+        histogram: Dict[str, Dict[str, int]] = {}
+        sampled = 0
+        async for doc in db[collection_name].aggregate([{"$sample": {"size": GitHubExportService.SCHEMA_SAMPLE_SIZE}}]):
+            sampled += 1
+            for field, value in doc.items():
+                if field != "_id":
+                    GitHubExportService._record_types(histogram, field, value)
+        
+        if not sampled:
+            return None
+        
+        field_types = {
+            path: dict(sorted(counts.items(), key=lambda item: -item[1]))
+            for path, counts in sorted(histogram.items())
+        }
+        return {
+            "name": collection_name,
+            # Most frequent type first, e.g. "str|NoneType" for an optional field
+            "fields": {path: "|".join(counts) for path, counts in field_types.items()},
+            "field_types": field_types,
+            "count": await db[collection_name].estimated_document_count(),
+            "sampled": sampled
+        }
+    
     @staticmethod
     async def export_schema(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
-        """Export database schema as JSON"""
-        collections = await db.list_collection_names()
+        """Export database schema as JSON (collections are sampled concurrently)"""
+        collections = sorted(
+            name for name in await db.list_collection_names(filter={"type": "collection"})
+            if not name.startswith("system.")
+        )
+        semaphore = asyncio.Semaphore(GitHubExportService.SCHEMA_PARALLELISM)
         
-        schema = {
-            "collections": [],
+        async def infer(collection_name: str):
+            async with semaphore:
+                return await GitHubExportService._collection_schema(db, collection_name)
+        
+        results = await asyncio.gather(*(infer(name) for name in collections))
+        
+        return {
+            "collections": [result for result in results if result],
             "export_date": datetime.now(timezone.utc).isoformat(),
             "version": "1.0"
         }
-        
-        for collection_name in collections:
-            # Get sample document to infer schema
-            sample = await db[collection_name].find_one()
-            
-            if sample:
-                collection_schema = {
-                    "name": collection_name,
-                    "fields": {},
-                    "count": await db[collection_name].count_documents({})
-                }
-                
-                # Infer types from sample
-                for field, value in sample.items():
-                    if field != "_id":
-                        collection_schema["fields"][field] = type(value).__name__
-                
-                schema["collections"].append(collection_schema)
-        
-        return schema
     
     @staticmethod
     def generate_readme(schema: Dict) -> str:
@@ -210,72 +641,394 @@ Total Collections: {len(schema['collections'])}
         for collection in schema['collections']:
             readme += f"""### {collection['name']}
 
-Document Count: {collection['count']}
+Document Count: ~{collection['count']} (estimated, {collection.get('sampled', 0)} sampled)
 
 Fields:
 """
             for field, field_type in collection['fields'].items():
-                readme += f"- `{field}` ({field_type})\n"
+                counts = collection.get('field_types', {}).get(field, {})
+                if len(counts) > 1:
+                    histogram = ", ".join(f"{name}: {count}" for name, count in counts.items())
+                    readme += f"- `{field}` ({field_type}; {histogram})\n"
+                else:
+                    readme += f"- `{field}` ({field_type})\n"
             readme += "\n"
         
         return readme
 
 
+class _HashingWriter:
+    """File wrapper that hashes and counts the bytes written through it"""
+    
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+    
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+    
+    def flush(self):
+        self.raw.flush()
+
+
+class _ChunkWriter:
+    """Writes NDJSON lines into rotating gzip files and records each file's size and sha256 (blocking, run in a thread)"""
+    
+    def __init__(self, directory: str, prefix: str, chunk_documents: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_documents = chunk_documents
+        self.files: List[Dict[str, Any]] = []
+        self._raw = None
+        self._hashing = None
+        self._gzip = None
+        self._name = None
+        self._count = 0
+    
+    def _open(self):
+        self._name = f"{self.prefix}.{len(self.files) + 1:04d}.ndjson.gz"
+        self._raw = open(os.path.join(self.directory, self._name), "wb")
+        self._hashing = _HashingWriter(self._raw)
+        self._gzip = gzip.GzipFile(filename="", mode="wb", fileobj=self._hashing)
+        self._count = 0
+    
+    def _close(self):
+        self._gzip.close()
+        self._raw.close()
+        self.files.append({
+            "name": self._name,
+            "documents": self._count,
+            "size_bytes": self._hashing.size,
+            "sha256": self._hashing.sha256.hexdigest()
+        })
+        self._gzip = None
+    
+    def write_lines(self, lines: List[str]):
+        while lines:
+            if self._gzip is None:
+                self._open()
+            room = self.chunk_documents - self._count
+            part, lines = lines[:room], lines[room:]
+            self._gzip.write(("\n".join(part) + "\n").encode("utf-8"))
+            self._count += len(part)
+            if self._count >= self.chunk_documents:
+                self._close()
+    
+    def close(self) -> List[Dict[str, Any]]:
+        if self._gzip is not None:
+            self._close()
+        return self.files
+
+
 class BackupService:
     """Handle daily cloud backups"""
     
+    BACKUP_DIR = os.environ.get("BACKUP_DIR", "/app/backups")
+    MANIFEST_NAME = "manifest.json"
+    
+    # Documents per compressed chunk file, and per batch handed to the compression thread
+    CHUNK_DOCUMENTS = 100000
+    WRITE_BATCH_SIZE = 1000
+    
+    # Collections restored concurrently
+    RESTORE_PARALLELISM = int(os.environ.get("RESTORE_PARALLELISM", "4"))
+    
+    # Field used as the incremental watermark; collections not listed use created_at
+    # (monthly audit log archives use timestamp like audit_logs)
+    WATERMARK_FIELDS = {
+        "inventory_items": "last_updated",
+        "product_costing": "last_updated",
+        "audit_logs": "timestamp",
+    }
+    
+    # Collections whose watermark field is stored as a BSON datetime rather than an
+    # ISO string; a string bound never matches a datetime field in a range query
+    DATETIME_WATERMARKS = {"user_sessions", "otp_verifications"}
+    
+    @staticmethod
+    def _watermark_field(collection_name: str) -> str:
+        if collection_name.startswith(AuditLogService.ARCHIVE_PREFIX):
+            return "timestamp"
+        return BackupService.WATERMARK_FIELDS.get(collection_name, "created_at")
+    
+    @staticmethod
+    def _incremental_query(collection_name: str, since: Optional[str]) -> Dict[str, Any]:
+        """Documents newer than `since` (an ISO timestamp from the base manifest), compared in the field's BSON type"""
+        if not since:
+            return {}
+        field = BackupService._watermark_field(collection_name)
+        bound = datetime.fromisoformat(since) if collection_name in BackupService.DATETIME_WATERMARKS else since
+        return {field: {"$gt": bound}}
+    
     @staticmethod
-    async def create_backup(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
-        """Create full database backup"""
-        backup_data = {
-            "backup_date": datetime.now(timezone.utc).isoformat(),
+    def _read_manifest(backup_path: str) -> Dict[str, Any]:
+        with open(os.path.join(backup_path, BackupService.MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _write_manifest(backup_path: str, manifest: Dict[str, Any]):
+        # Written last and renamed into place: a backup without a manifest is incomplete
+        partial_path = os.path.join(backup_path, BackupService.MANIFEST_NAME + ".part")
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(partial_path, os.path.join(backup_path, BackupService.MANIFEST_NAME))
+    
+    @staticmethod
+    def _find_latest_manifest() -> Optional[Dict[str, Any]]:
+        if not os.path.isdir(BackupService.BACKUP_DIR):
+            return None
+        for name in sorted(os.listdir(BackupService.BACKUP_DIR), reverse=True):
+            path = os.path.join(BackupService.BACKUP_DIR, name)
+            if os.path.isfile(os.path.join(path, BackupService.MANIFEST_NAME)):
+                return BackupService._read_manifest(path)
+        return None
+    
+    @staticmethod
+    async def _backup_collection(db: AsyncIOMotorDatabase, backup_path: str, collection_name: str,
+                                 query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Stream one collection into gzip NDJSON chunks (relaxed Extended JSON, _id kept)"""
+        writer = _ChunkWriter(backup_path, collection_name, BackupService.CHUNK_DOCUMENTS)
+        lines = []
+        async for doc in db[collection_name].find(query).batch_size(BackupService.WRITE_BATCH_SIZE):
+            lines.append(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+            if len(lines) >= BackupService.WRITE_BATCH_SIZE:
+                await asyncio.to_thread(writer.write_lines, lines)
+                lines = []
+        if lines:
+            await asyncio.to_thread(writer.write_lines, lines)
+        return await asyncio.to_thread(writer.close)
+    
+    @staticmethod
+    async def create_backup(db: AsyncIOMotorDatabase, incremental: bool = False) -> Dict[str, Any]:
+        """
+        Create a database backup: one directory holding compressed NDJSON chunks per
+        collection and a manifest with document counts, checksums and watermarks.
+        An incremental backup only takes documents whose watermark field (created_at,
+        or last_updated/timestamp, see WATERMARK_FIELDS) is newer than the previous
+        backup; it falls back to a full backup when there is none. Deletions, documents
+        without the watermark field, and edits to documents tracked by created_at are
+        only captured by full backups.
+        """
+        started = datetime.now(timezone.utc)
+        backup_name = f"backup_{started.strftime('%Y%m%d_%H%M%S')}"
+        backup_path = os.path.join(BackupService.BACKUP_DIR, backup_name)
+        await asyncio.to_thread(os.makedirs, backup_path, exist_ok=True)
+        
+        base = await asyncio.to_thread(BackupService._find_latest_manifest) if incremental else None
+        manifest = {
+            "backup_id": backup_name,
+            "type": "incremental" if base else "full",
+            "base_backup": base["backup_id"] if base else None,
+            "backup_date": started.isoformat(),
+            "format": "ndjson.gz",
             "collections": {}
         }
         
-        collections = await db.list_collection_names()
-        
+        collections = sorted(
+            name for name in await db.list_collection_names()
+            if not name.startswith("system.")
+        )
         for collection_name in collections:
-            data = await db[collection_name].find({}, {"_id": 0}).to_list(100000)
-            backup_data["collections"][collection_name] = data
-        
-        # Save to file
-        backup_filename = f"backup_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.json"
-        backup_path = os.path.join("/app/backups", backup_filename)
-        
-        os.makedirs("/app/backups", exist_ok=True)
+            field = BackupService._watermark_field(collection_name)
+            since = base["collections"].get(collection_name, {}).get("watermark") if base else None
+            query = BackupService._incremental_query(collection_name, since)
+            
+            files = await BackupService._backup_collection(db, backup_path, collection_name, query)
+            manifest["collections"][collection_name] = {
+                "watermark_field": field,
+                "since": since,
+                # Everything up to the start of this run is covered; the next increment starts here
+                "watermark": started.isoformat(),
+                "documents": sum(f["documents"] for f in files),
+                "files": files
+            }
         
-        with open(backup_path, 'w') as f:
-            json.dump(backup_data, f, indent=2, ensure_ascii=False)
+        await asyncio.to_thread(BackupService._write_manifest, backup_path, manifest)
         
-        # Get file size
-        file_size = os.path.getsize(backup_path)
+        file_size = sum(f["size_bytes"] for entry in manifest["collections"].values() for f in entry["files"])
+        logger.info(f"{manifest['type'].capitalize()} backup {backup_name} written ({file_size} bytes)")
         
         return {
-            "filename": backup_filename,
+            "filename": backup_name,
             "path": backup_path,
+            "type": manifest["type"],
+            "base_backup": manifest["base_backup"],
             "size_bytes": file_size,
             "size_mb": round(file_size / 1024 / 1024, 2),
             "collections_backed_up": len(collections),
-            "created_at": backup_data["backup_date"]
+            "documents": sum(entry["documents"] for entry in manifest["collections"].values()),
+            "created_at": manifest["backup_date"]
+        }
+    
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    async def verify_backup(backup_path: str) -> Dict[str, Any]:
+        """Recompute every chunk checksum against the manifest"""
+        manifest = await asyncio.to_thread(BackupService._read_manifest, backup_path)
+        mismatched = []
+        for collection_name, entry in manifest["collections"].items():
+            for f in entry["files"]:
+                path = os.path.join(backup_path, f["name"])
+                if not os.path.exists(path):
+                    mismatched.append({"collection": collection_name, "file": f["name"], "error": "missing"})
+                elif await asyncio.to_thread(BackupService._file_sha256, path) != f["sha256"]:
+                    mismatched.append({"collection": collection_name, "file": f["name"], "error": "checksum mismatch"})
+        return {"backup_id": manifest["backup_id"], "valid": not mismatched, "mismatched": mismatched}
+    
+    @staticmethod
+    def _iter_chunk_documents(path: str) -> Iterator[Dict[str, Any]]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+    
+    @staticmethod
+    async def _insert_stream(db: AsyncIOMotorDatabase, collection_name: str, documents: Iterator[Dict[str, Any]],
+                             upsert: bool, batch_size: int) -> int:
+        """
+        Write documents in bounded batches. The next batch is decoded in a worker
+        thread while the current one is being written, so reads and writes overlap.
+        """
+        def read_batch():
+            return list(itertools.islice(documents, batch_size))
+        
+        restored = 0
+        batch = await asyncio.to_thread(read_batch)
+        while batch:
+            next_batch = asyncio.create_task(asyncio.to_thread(read_batch))
+            try:
+                if upsert:
+                    await db[collection_name].bulk_write(
+                        [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch],
+                        ordered=False
+                    )
+                else:
+                    await db[collection_name].insert_many(batch, ordered=False)
+            except BaseException:
+                next_batch.cancel()
+                raise
+            restored += len(batch)
+            batch = await next_batch
+        return restored
+    
+    @staticmethod
+    async def _rebuild_indexes(db: AsyncIOMotorDatabase, collection_name: str) -> List[Dict[str, Any]]:
+        if collection_name.startswith(AuditLogService.ARCHIVE_PREFIX):
+            try:
+                await AuditLogService.ensure_indexes(db[collection_name])
+                return []
+            except Exception as e:
+                return [{"collection": collection_name, "index": None, "error": str(e)}]
+        return (await IndexService.ensure_indexes(db, collections=[collection_name]))["errors"]
+    
+    @staticmethod
+    async def _restore_collection(db: AsyncIOMotorDatabase, backup_path: str, collection_name: str,
+                                  entry: Dict[str, Any], incremental: bool, batch_size: int,
+                                  verify: bool) -> Dict[str, Any]:
+        if verify:
+            for f in entry["files"]:
+                checksum = await asyncio.to_thread(BackupService._file_sha256, os.path.join(backup_path, f["name"]))
+                if checksum != f["sha256"]:
+                    raise ValueError(f"Checksum mismatch in {f['name']}, restore of {collection_name} aborted")
+        
+        if not incremental:
+            # Dropping removes data and indexes at once; indexes are rebuilt after the load
+            await db[collection_name].drop()
+        
+        restored = 0
+        for f in entry["files"]:
+            documents = BackupService._iter_chunk_documents(os.path.join(backup_path, f["name"]))
+            restored += await BackupService._insert_stream(db, collection_name, documents, incremental, batch_size)
+        
+        index_errors = [] if incremental else await BackupService._rebuild_indexes(db, collection_name)
+        logger.info(f"Restored {restored} documents into {collection_name}")
+        return {"documents": restored, "index_errors": index_errors}
+    
+    @staticmethod
+    async def restore_backup(db: AsyncIOMotorDatabase, backup_path: str,
+                             parallelism: int = RESTORE_PARALLELISM,
+                             batch_size: int = WRITE_BATCH_SIZE,
+                             verify: bool = True):
+        """
+        Restore database from backup, streaming each chunk file in bounded batches and
+        restoring up to `parallelism` collections at once. A full backup replaces each
+        collection (indexes are dropped and rebuilt from the registry after the load);
+        an incremental one is applied on top by replacing documents by _id.
+        Chunk checksums are checked before a collection is touched.
+        Legacy single-file JSON backups are still accepted.
+        """
+        if os.path.isfile(backup_path):
+            return await BackupService._restore_legacy_backup(db, backup_path, parallelism, batch_size)
+        
+        manifest = await asyncio.to_thread(BackupService._read_manifest, backup_path)
+        incremental = manifest["type"] == "incremental"
+        semaphore = asyncio.Semaphore(parallelism)
+        
+        async def restore(collection_name: str, entry: Dict[str, Any]):
+            async with semaphore:
+                return await BackupService._restore_collection(
+                    db, backup_path, collection_name, entry, incremental, batch_size, verify
+                )
+        
+        names = list(manifest["collections"])
+        results = await asyncio.gather(
+            *(restore(name, manifest["collections"][name]) for name in names),
+            return_exceptions=True
+        )
+        
+        # One failing collection does not abort the others; it is reported instead
+        documents = {}
+        failed = {}
+        index_errors = []
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"Restore of {name} failed: {result}")
+                failed[name] = str(result)
+            else:
+                documents[name] = result["documents"]
+                index_errors.extend(result["index_errors"])
+        
+        return {
+            "restored_collections": len(documents),
+            "backup_date": manifest["backup_date"],
+            "type": manifest["type"],
+            "documents": documents,
+            "failed": failed,
+            "index_errors": index_errors
         }
     
     @staticmethod
-    async def restore_backup(db: AsyncIOMotorDatabase, backup_path: str):
-        """Restore database from backup"""
-        with open(backup_path, 'r') as f:
-            backup_data = json.load(f)
+    async def _restore_legacy_backup(db: AsyncIOMotorDatabase, backup_path: str,
+                                     parallelism: int, batch_size: int):
+        """Restore a pre-manifest backup_*.json file (the file itself has to be loaded whole)"""
+        def load():
+            with open(backup_path, 'r') as f:
+                return json.load(f)
+        
+        backup_data = await asyncio.to_thread(load)
+        semaphore = asyncio.Semaphore(parallelism)
         
-        restored_collections = 0
+        async def restore(collection_name: str, data: List[Dict[str, Any]]):
+            async with semaphore:
+                await db[collection_name].drop()
+                await BackupService._insert_stream(db, collection_name, iter(data), False, batch_size)
+                return await BackupService._rebuild_indexes(db, collection_name)
         
-        for collection_name, data in backup_data["collections"].items():
-            if data:
-                # Clear existing data
-                await db[collection_name].delete_many({})
-                # Restore
-                await db[collection_name].insert_many(data)
-                restored_collections += 1
+        restorable = {name: data for name, data in backup_data["collections"].items() if data}
+        results = await asyncio.gather(*(restore(name, data) for name, data in restorable.items()))
         
         return {
-            "restored_collections": restored_collections,
-            "backup_date": backup_data["backup_date"]
+            "restored_collections": len(restorable),
+            "backup_date": backup_data["backup_date"],
+            "index_errors": [error for errors in results for error in errors]
         }
@@ -0,0 +1,194 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from typing import Dict, Any, List, Optional
+import logging
+
+from audit_service import AuditLogService
+
+logger = logging.getLogger(__name__)
+
+
+def _index(keys: List, name: str, unique: bool = False, expire_after_seconds: Optional[int] = None) -> Dict[str, Any]:
+    spec = {"keys": keys, "name": name, "unique": unique}
+    if expire_after_seconds is not None:
+        spec["expire_after_seconds"] = expire_after_seconds
+    return spec
+
+
+def _id_unique() -> Dict[str, Any]:
+    return _index([("id", ASCENDING)], "id_unique", unique=True)
+
+
+def _code_unique() -> Dict[str, Any]:
+    return _index([("code", ASCENDING)], "code_unique", unique=True)
+
+
+def _created_at_page() -> Dict[str, Any]:
+    # Matches the (created_at, id) keyset sort used by list endpoints
+    return _index([("created_at", ASCENDING), ("id", ASCENDING)], "created_at_id")
+
+
+# Declarative registry: collection -> indexes the backend relies on.
+# Unique constraints mirror the duplicate checks the endpoints already perform;
+# TTL indexes let MongoDB purge expired sessions and OTPs on its own.
+INDEX_REGISTRY: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        _id_unique(),
+        _index([("email", ASCENDING)], "email_unique", unique=True),
+        _created_at_page(),
+    ],
+    "user_sessions": [
+        _index([("session_token", ASCENDING)], "session_token_unique", unique=True),
+        _index([("user_id", ASCENDING)], "user_id"),
+        _index([("expires_at", ASCENDING)], "expires_at_ttl", expire_after_seconds=0),
+    ],
+    "otp_verifications": [
+        _index([("user_id", ASCENDING), ("otp_code", ASCENDING), ("verified", ASCENDING)], "user_otp"),
+        _index([("expires_at", ASCENDING)], "expires_at_ttl", expire_after_seconds=0),
+    ],
+    "products": [_id_unique(), _code_unique(), _created_at_page()],
+    "warehouses": [_id_unique(), _code_unique(), _created_at_page()],
+    "bins": [
+        _id_unique(),
+        _index([("warehouse_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], "warehouse_created_at"),
+        _created_at_page(),
+    ],
+    "inventory_items": [
+        # id is also the keyset for GET /inventory (last_updated changes on every move)
+        _id_unique(),
+        _index([("product_id", ASCENDING), ("warehouse_id", ASCENDING), ("bin_id", ASCENDING)],
+               "inventory_location_unique", unique=True),
+        _index([("warehouse_id", ASCENDING), ("id", ASCENDING)], "warehouse_id_id"),
+    ],
+    "stock_moves": [
+        _id_unique(),
+        _index([("product_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "product_created_at"),
+        _index([("created_at", DESCENDING), ("id", DESCENDING)], "created_at_id"),
+        _index([("from_warehouse_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "from_warehouse_created_at"),
+        _index([("to_warehouse_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "to_warehouse_created_at"),
+        _index([("from_bin_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "from_bin_created_at_id"),
+        _index([("to_bin_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "to_bin_created_at_id"),
+        _index([("move_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "move_type_created_at"),
+        _index([("reference", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "reference_created_at_id"),
+    ],
+    "adjustments": [
+        _id_unique(),
+        _index([("created_at", DESCENDING), ("id", DESCENDING)], "created_at_id"),
+    ],
+    "boms": [
+        _id_unique(),
+        _index([("product_id", ASCENDING)], "product_id"),
+        _created_at_page(),
+    ],
+    "work_centers": [_id_unique(), _code_unique(), _created_at_page()],
+    "employees": [_id_unique(), _code_unique(), _created_at_page()],
+    "suppliers": [_id_unique(), _code_unique(), _created_at_page()],
+    "customers": [_id_unique(), _code_unique(), _created_at_page()],
+    "stock_snapshots": [
+        _id_unique(),
+        _index([("as_of", DESCENDING)], "as_of"),
+    ],
+    "stock_snapshot_balances": [
+        _index([("snapshot_id", ASCENDING), ("product_id", ASCENDING), ("warehouse_id", ASCENDING)], "snapshot_location"),
+    ],
+    "export_jobs": [
+        _id_unique(),
+        _index([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "user_created_at"),
+        _index([("status", ASCENDING), ("expires_at", ASCENDING)], "status_expires_at"),
+    ],
+    "import_runs": [_id_unique()],
+    "webhook_subscriptions": [
+        _id_unique(),
+        _index([("events", ASCENDING), ("is_active", ASCENDING)], "events_active"),
+    ],
+    "webhook_deliveries": [
+        _id_unique(),
+        _index([("status", ASCENDING), ("next_attempt_at", ASCENDING)], "status_next_attempt"),
+        _index([("status", ASCENDING), ("lease_until", ASCENDING)], "status_lease_until"),
+        _index([("purge_at", ASCENDING)], "purge_at_ttl", expire_after_seconds=0),
+    ],
+    "webhook_dead_letters": [
+        _id_unique(),
+        _index([("subscription_id", ASCENDING), ("dead_lettered_at", DESCENDING)], "subscription_dead_lettered_at"),
+    ],
+    "product_costing": [
+        _index([("product_id", ASCENDING), ("warehouse_id", ASCENDING)], "product_warehouse_unique", unique=True),
+    ],
+    "production_orders": [_id_unique()],
+    "wip_transactions": [
+        _index([("production_order_id", ASCENDING)], "production_order_id"),
+    ],
+    "attendance": [
+        _index([("employee_id", ASCENDING), ("date", ASCENDING)], "employee_date"),
+    ],
+    "audit_logs": [_id_unique()] + [_index(keys, name) for keys, name in AuditLogService.INDEXES],
+}
+
+
+class IndexService:
+    """Applies the index registry and reports drift against the live database"""
+
+    @staticmethod
+    async def ensure_indexes(db: AsyncIOMotorDatabase, collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Create every registered index (idempotent).
+        Failures (e.g. duplicate data blocking a unique index) are logged and
+        reported instead of aborting startup.
+        """
+        created = 0
+        errors = []
+
+        for collection_name, specs in INDEX_REGISTRY.items():
+            if collections is not None and collection_name not in collections:
+                continue
+
+            for spec in specs:
+                options = {"name": spec["name"], "unique": spec["unique"]}
+                if "expire_after_seconds" in spec:
+                    options["expireAfterSeconds"] = spec["expire_after_seconds"]
+                try:
+                    await db[collection_name].create_index(spec["keys"], **options)
+                    created += 1
+                except Exception as e:
+                    logger.error(f"Failed to create index {collection_name}.{spec['name']}: {e}")
+                    errors.append({"collection": collection_name, "index": spec["name"], "error": str(e)})
+
+        return {"indexes_applied": created, "errors": errors}
+
+    @staticmethod
+    async def report(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """List registered indexes that are missing and existing indexes that have never been used"""
+        existing_collections = set(await db.list_collection_names())
+        missing = []
+        unused = []
+        unregistered = []
+
+        for collection_name, specs in INDEX_REGISTRY.items():
+            if collection_name not in existing_collections:
+                missing.extend({"collection": collection_name, "index": spec["name"]} for spec in specs)
+                continue
+
+            info = await db[collection_name].index_information()
+            existing_keys = {tuple(index["key"]): name for name, index in info.items()}
+            registered_keys = {tuple(spec["keys"]) for spec in specs}
+
+            for spec in specs:
+                if tuple(spec["keys"]) not in existing_keys:
+                    missing.append({"collection": collection_name, "index": spec["name"]})
+
+            for keys, name in existing_keys.items():
+                if name != "_id_" and keys not in registered_keys:
+                    unregistered.append({"collection": collection_name, "index": name})
+
+            stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+            for stat in stats:
+                if stat["name"] == "_id_":
+                    continue
+                if stat.get("accesses", {}).get("ops", 0) == 0:
+                    unused.append({
+                        "collection": collection_name,
+                        "index": stat["name"],
+                        "since": stat.get("accesses", {}).get("since")
+                    })
+
+        return {"missing": missing, "unused": unused, "unregistered": unregistered}
@@ -1,19 +1,26 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Query, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Any
 import uuid
+import json
+import base64
 from datetime import datetime, timezone, timedelta
 from enum import Enum
 import bcrypt
-import requests
 import random
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client
 from models_masters import (
     BOM, BOMCreate, BOMComponent,
@@ -22,6 +29,15 @@ from models_masters import (
     Supplier, SupplierCreate,
     Customer, CustomerCreate
 )
+from session_cache import SessionCache
+from auth_service import OAuthSessionClient
+from sms_service import SMSDispatcher, TwilioSMSTransport, FakeSMSTransport
+from audit_service import AuditLogBuffer, AuditLogService
+from index_service import IndexService
+from snapshot_service import StockSnapshotService
+from export_service import ExportService, ExportRequest, ImportService
+from export_job_service import ExportJobManager, ExportJobLimitError, parse_range_header, iter_file_range
+from webhook_service import WebhookDispatcher, subscription_routes
 
 
 ROOT_DIR = Path(__file__).parent
@@ -32,6 +48,19 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Multi-document transactions need a replica set; set MONGO_TRANSACTIONS=false on a standalone server
+# (it is also switched off automatically the first time the server rejects a transaction)
+transactions_enabled = os.environ.get('MONGO_TRANSACTIONS', 'true').lower() == 'true'
+# Reruns of a transaction callback that lost an inventory upsert race
+TRANSACTION_DUPLICATE_KEY_RETRIES = 3
+
+# Audit records are buffered and written in batches
+audit_buffer = AuditLogBuffer(
+    db,
+    flush_size=int(os.environ.get('AUDIT_FLUSH_SIZE', '100')),
+    flush_interval_seconds=float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', '1.0'))
+)
+
 # Twilio setup (will be configured with env vars)
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
@@ -41,6 +70,59 @@ twilio_client = None
 if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
     twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Outbound SMS queue (SMS_TRANSPORT=fake logs messages instead of sending them)
+sms_dispatcher = None
+if os.environ.get('SMS_TRANSPORT', '').lower() == 'fake':
+    sms_dispatcher = SMSDispatcher(FakeSMSTransport())
+elif twilio_client:
+    sms_dispatcher = SMSDispatcher(
+        TwilioSMSTransport(twilio_client, TWILIO_PHONE_NUMBER),
+        batch_size=int(os.environ.get('SMS_BATCH_SIZE', '20')),
+        max_attempts=int(os.environ.get('SMS_MAX_ATTEMPTS', '5'))
+    )
+
+# Password hashing runs on a bounded thread pool so bcrypt never blocks the event loop
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', '12'))
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '4')),
+    thread_name_prefix="bcrypt"
+)
+
+# Validated session cache in front of get_current_user (per worker process)
+session_cache = SessionCache(
+    ttl_seconds=float(os.environ.get('SESSION_CACHE_TTL_SECONDS', '30')),
+    max_size=int(os.environ.get('SESSION_CACHE_MAX_SIZE', '10000'))
+)
+
+# Emergent OAuth session exchange (URL overridable so it can point at a local stub)
+oauth_client = OAuthSessionClient(
+    session_data_url=os.environ.get(
+        'EMERGENT_AUTH_SESSION_URL',
+        'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data'
+    ),
+    timeout=float(os.environ.get('OAUTH_TIMEOUT_SECONDS', '5')),
+    max_retries=int(os.environ.get('OAUTH_MAX_RETRIES', '2')),
+    cache_ttl_seconds=float(os.environ.get('OAUTH_SESSION_CACHE_TTL_SECONDS', '60'))
+)
+
+# Background export jobs; artifacts are kept on local disk until they expire
+export_job_manager = ExportJobManager(
+    db,
+    artifact_dir=os.environ.get('EXPORT_ARTIFACT_DIR', '/app/exports'),
+    workers=int(os.environ.get('EXPORT_WORKERS', '2')),
+    max_active_per_user=int(os.environ.get('EXPORT_MAX_ACTIVE_PER_USER', '2')),
+    artifact_ttl_seconds=float(os.environ.get('EXPORT_ARTIFACT_TTL_HOURS', '24')) * 3600
+)
+
+# Persistent webhook delivery queue worker (webhook_deliveries -> subscriber endpoints)
+webhook_dispatcher = WebhookDispatcher(
+    db,
+    max_in_flight=int(os.environ.get('WEBHOOK_MAX_IN_FLIGHT', '50')),
+    per_endpoint_concurrency=int(os.environ.get('WEBHOOK_PER_ENDPOINT_CONCURRENCY', '4')),
+    max_attempts=int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '8')),
+    timeout=float(os.environ.get('WEBHOOK_TIMEOUT_SECONDS', '10'))
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -49,6 +131,10 @@ api_router = APIRouter(prefix="/api")
 
 security = HTTPBearer(auto_error=False)
 
+# Pagination defaults for list endpoints
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+
 
 # Enums
 class StockMoveType(str, Enum):
@@ -219,6 +305,10 @@ class StockMoveCreate(BaseModel):
     notes: Optional[str] = None
 
 
+class StockMoveBulkCreate(BaseModel):
+    moves: List[StockMoveCreate] = Field(..., max_length=10000)
+
+
 class Adjustment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -239,33 +329,35 @@ class AdjustmentCreate(BaseModel):
 
 
 # Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def _hash_password_sync(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=PASSWORD_HASH_ROUNDS)).decode('utf-8')
 
 
-def verify_password(password: str, password_hash: str) -> bool:
+def _verify_password_sync(password: str, password_hash: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
 
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, _hash_password_sync, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, _verify_password_sync, password, password_hash)
+
+
 def generate_otp() -> str:
     return str(random.randint(100000, 999999))
 
 
 async def send_sms_otp(phone: str, otp: str):
-    if not twilio_client:
+    if not sms_dispatcher:
         logging.warning("Twilio not configured. OTP not sent.")
         return False
     
-    try:
-        message = twilio_client.messages.create(
-            body=f"Your verification code is: {otp}",
-            from_=TWILIO_PHONE_NUMBER,
-            to=phone
-        )
-        return True
-    except Exception as e:
-        logging.error(f"Failed to send SMS: {e}")
-        return False
+    # Queued for the background sender; delivery failures are retried there
+    return sms_dispatcher.enqueue(phone, f"Your verification code is: {otp}")
 
 
 async def log_audit(user_id: str, user_email: str, action: AuditAction, resource_type: str, 
@@ -279,10 +371,10 @@ async def log_audit(user_id: str, user_email: str, action: AuditAction, resource
         before_data=before_data,
         after_data=after_data
     )
-    await db.audit_logs.insert_one(audit.model_dump())
+    await audit_buffer.add(audit.model_dump())
 
 
-async def get_current_user(request: Request) -> User:
+def get_session_token(request: Request) -> Optional[str]:
     # Check cookie first
     session_token = request.cookies.get("session_token")
     
@@ -292,9 +384,19 @@ async def get_current_user(request: Request) -> User:
         if auth_header and auth_header.startswith("Bearer "):
             session_token = auth_header.replace("Bearer ", "")
     
+    return session_token
+
+
+async def get_current_user(request: Request) -> User:
+    session_token = get_session_token(request)
+    
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
+    
     # Find session
     session = await db.user_sessions.find_one({"session_token": session_token})
     if not session:
@@ -318,7 +420,131 @@ async def get_current_user(request: Request) -> User:
     if not user.get("is_active", True):
         raise HTTPException(status_code=403, detail="User is inactive")
     
-    return User(**user)
+    user_obj = User(**user)
+    session_cache.set(session_token, expires_at, user_obj)
+    
+    return user_obj
+
+
+class PageParams:
+    """Common keyset pagination query parameters shared by all list endpoints"""
+    
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        fields: Optional[str] = None
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = fields
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    raw = json.dumps([doc.get(sort_field), doc["id"]])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, last_id
+
+
+def build_projection(fields: Optional[str], sort_field: str, exclude: tuple = ()) -> dict:
+    if not fields:
+        projection = {"_id": 0}
+        for field in exclude:
+            projection[field] = 0
+        return projection
+    
+    def covered(path: str, parents) -> bool:
+        return any(path == parent or path.startswith(parent + ".") for parent in parents)
+    
+    # id and the sort key are always returned so the next cursor can be built
+    projection = {"_id": 0, "id": 1, sort_field: 1}
+    requested = {field.strip() for field in fields.split(",")}
+    # Parents first, so a path under a field already projected (a, a.b) is dropped:
+    # MongoDB rejects colliding paths. _id is never returned (ObjectId is not JSON).
+    for field in sorted(requested, key=lambda path: (path.count("."), path)):
+        if (not field or field.startswith("$") or "" in field.split(".")
+                or covered(field, ("_id",) + tuple(exclude)) or covered(field, projection)):
+            continue
+        projection[field] = 1
+    return projection
+
+
+async def paginate(collection, query: dict, response: Response, page: PageParams,
+                   sort_field: str = "created_at", direction: int = DESCENDING, exclude: tuple = ()) -> List[dict]:
+    """
+    Keyset pagination over (sort_field, id).
+    Returns one page of documents and sets the X-Next-Cursor header when more remain.
+    """
+    if page.cursor:
+        sort_value, last_id = decode_cursor(page.cursor)
+        op = "$lt" if direction == DESCENDING else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_field: {op: sort_value}},
+            {sort_field: sort_value, "id": {op: last_id}}
+        ]}]}
+    
+    sort = [(sort_field, direction)] if sort_field == "id" else [(sort_field, direction), ("id", direction)]
+    docs = await collection.find(query, build_projection(page.fields, sort_field, exclude)) \
+        .sort(sort) \
+        .limit(page.limit + 1) \
+        .to_list(page.limit + 1)
+    
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1], sort_field)
+    
+    return docs
+
+
+def utc_isoformat(value: str) -> str:
+    """
+    Normalize an ISO-8601 timestamp to the UTC form timestamps are stored in,
+    so string comparison matches time order. Naive timestamps are taken as UTC.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc).isoformat()
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def date_range_query(start_date: Optional[str], end_date: Optional[str]) -> dict:
+    """
+    Range filter on ISO-8601 timestamp strings (stored as UTC).
+    Timestamps with an offset are converted to UTC first.
+    A date-only end_date (YYYY-MM-DD) includes the whole day.
+    """
+    date_filter = {}
+    try:
+        if start_date:
+            date_filter["$gte"] = utc_isoformat(start_date) if len(start_date) > 10 else start_date
+        if end_date:
+            if len(end_date) == 10:
+                next_day = datetime.fromisoformat(end_date) + timedelta(days=1)
+                date_filter["$lt"] = next_day.date().isoformat()
+            else:
+                date_filter["$lte"] = utc_isoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected ISO-8601")
+    return date_filter
+
+
+async def ndjson_stream(cursor, lines_per_chunk: int = 500):
+    """Yield newline-delimited JSON in chunks of lines_per_chunk documents"""
+    lines = []
+    async for doc in cursor:
+        lines.append(json.dumps(doc, default=str))
+        if len(lines) >= lines_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
 
 
 def check_permission(required_roles: List[UserRole]):
@@ -329,33 +555,256 @@ def check_permission(required_roles: List[UserRole]):
     return permission_checker
 
 
-async def update_inventory(product_id: str, warehouse_id: str, bin_id: Optional[str], quantity_change: float):
-    query = {
+def is_duplicate_key_error(exc: Exception) -> bool:
+    if isinstance(exc, DuplicateKeyError):
+        return True
+    write_errors = exc.details.get("writeErrors", []) if isinstance(exc, BulkWriteError) else []
+    return bool(write_errors) and all(error.get("code") == 11000 for error in write_errors)
+
+
+async def run_in_transaction(callback):
+    """
+    Run `callback(session)` in a multi-document transaction.
+    with_transaction retries the whole callback on TransientTransactionError
+    and retries the commit on UnknownTransactionCommitResult; a duplicate key
+    from racing upserts reruns the callback a bounded number of times.
+    """
+    global transactions_enabled
+    if transactions_enabled:
+        try:
+            async with await client.start_session() as session:
+                for attempt in range(TRANSACTION_DUPLICATE_KEY_RETRIES + 1):
+                    try:
+                        return await session.with_transaction(callback)
+                    except (DuplicateKeyError, BulkWriteError) as e:
+                        # Two upserts raced to create the same inventory row. with_transaction only
+                        # retries TransientTransactionError, so rerun the callback here: the row now
+                        # exists and the upsert matches it
+                        if attempt == TRANSACTION_DUPLICATE_KEY_RETRIES or not is_duplicate_key_error(e):
+                            raise
+                        logging.info(f"Retrying transaction after duplicate key on upsert (attempt {attempt + 1})")
+        except OperationFailure as e:
+            # IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+            if e.code != 20:
+                raise
+            transactions_enabled = False
+            logging.warning("MongoDB does not support transactions; posting without them")
+    
+    return await callback(None)
+
+
+def inventory_legs(move: StockMove) -> List[tuple]:
+    """(warehouse_id, bin_id, quantity_change) for each inventory row a stock move touches"""
+    if move.move_type == StockMoveType.RECEIPT:
+        return [(move.to_warehouse_id, move.to_bin_id, move.quantity)]
+    elif move.move_type == StockMoveType.ISSUE:
+        return [(move.from_warehouse_id, move.from_bin_id, -move.quantity)]
+    elif move.move_type == StockMoveType.TRANSFER:
+        return [
+            (move.from_warehouse_id, move.from_bin_id, -move.quantity),
+            (move.to_warehouse_id, move.to_bin_id, move.quantity)
+        ]
+    return []
+
+
+def insufficient_stock_detail(product_id: str, warehouse_id: str, bin_id: Optional[str], requested: float) -> dict:
+    location = f"bin {bin_id}" if bin_id else f"warehouse {warehouse_id}"
+    return {
+        "message": f"Insufficient stock in {location}",
         "product_id": product_id,
-        "warehouse_id": warehouse_id
+        "warehouse_id": warehouse_id,
+        "bin_id": bin_id,
+        "requested": requested
     }
-    if bin_id:
-        query["bin_id"] = bin_id
+
+
+async def explain_warehouse_shortfall(detail: dict, session=None) -> dict:
+    """
+    A move that names only a warehouse draws on its unbinned row. When the stock is
+    held in bins instead, say so, so the caller knows to name the bin to take it from.
+    """
+    if detail["bin_id"] is not None:
+        return detail
+    totals = await db.inventory_items.aggregate([
+        {"$match": {"product_id": detail["product_id"], "warehouse_id": detail["warehouse_id"], "bin_id": {"$ne": None}}},
+        {"$group": {"_id": None, "quantity": {"$sum": "$quantity"}}}
+    ], session=session).to_list(None)
+    binned = totals[0]["quantity"] if totals else 0
+    if binned > 0:
+        detail["message"] = (
+            f"Stock in warehouse {detail['warehouse_id']} is held in bins; specify the bin to take it from"
+        )
+        detail["binned_quantity"] = binned
+    return detail
+
+
+async def debit_inventory(product_id: str, warehouse_id: str, bin_id: Optional[str], quantity: float,
+                          session=None) -> bool:
+    """
+    Conditional atomic decrement: only applies if the row holds at least `quantity`.
+    Returns False on shortfall, without a read-then-write race.
+    bin_id=None means the warehouse's unbinned row, never the warehouse total: stock in
+    bins is only debited when the move names the bin (explain_warehouse_shortfall
+    tells the caller so), which keeps every row, unbinned included, from going negative.
+    """
+    result = await db.inventory_items.update_one(
+        {
+            "product_id": product_id,
+            "warehouse_id": warehouse_id,
+            "bin_id": bin_id,
+            "quantity": {"$gte": quantity}
+        },
+        {
+            "$inc": {"quantity": -quantity},
+            "$set": {"last_updated": datetime.now(timezone.utc).isoformat()}
+        },
+        session=session
+    )
+    return result.matched_count == 1
+
+
+async def update_inventory(product_id: str, warehouse_id: str, bin_id: Optional[str], quantity_change: float,
+                           session=None, enforce_available: bool = False):
+    if enforce_available and quantity_change < 0:
+        if not await debit_inventory(product_id, warehouse_id, bin_id, -quantity_change, session=session):
+            raise HTTPException(
+                status_code=409,
+                detail=await explain_warehouse_shortfall(
+                    insufficient_stock_detail(product_id, warehouse_id, bin_id, -quantity_change), session=session
+                )
+            )
+        return
     
-    existing = await db.inventory_items.find_one(query)
+    # Single atomic upsert keyed on the unique (product_id, warehouse_id, bin_id) index,
+    # so concurrent moves on the same row cannot lose updates
+    query = {
+        "product_id": product_id,
+        "warehouse_id": warehouse_id,
+        "bin_id": bin_id
+    }
+    update = {
+        "$inc": {"quantity": quantity_change},
+        "$set": {"last_updated": datetime.now(timezone.utc).isoformat()},
+        "$setOnInsert": {"id": str(uuid.uuid4())}
+    }
     
-    if existing:
-        new_quantity = existing["quantity"] + quantity_change
-        await db.inventory_items.update_one(
-            query,
-            {"$set": {
-                "quantity": new_quantity,
-                "last_updated": datetime.now(timezone.utc).isoformat()
-            }}
+    try:
+        await db.inventory_items.update_one(query, update, upsert=True, session=session)
+    except DuplicateKeyError:
+        # Inside a transaction the write error aborts it; run_in_transaction reruns the callback
+        if session:
+            raise
+        # Two upserts raced to create the same row; the loser retries as a plain update
+        await db.inventory_items.update_one(query, update)
+
+
+def fold_inventory_deltas(moves: List[StockMove]) -> dict:
+    """Net quantity change per (product_id, warehouse_id, bin_id) across many moves"""
+    deltas = {}
+    for move in moves:
+        for warehouse_id, bin_id, quantity_change in inventory_legs(move):
+            key = (move.product_id, warehouse_id, bin_id)
+            deltas[key] = deltas.get(key, 0.0) + quantity_change
+    return deltas
+
+
+def inventory_debit_keys(move: StockMove) -> List[tuple]:
+    return [
+        (move.product_id, warehouse_id, bin_id)
+        for warehouse_id, bin_id, quantity_change in inventory_legs(move)
+        if quantity_change < 0
+    ]
+
+
+async def load_inventory_quantities(keys: set, session=None) -> dict:
+    """Quantity on hand per (product_id, warehouse_id, bin_id) key; rows that do not exist are left out"""
+    if not keys:
+        return {}
+    rows = await db.inventory_items.find(
+        {"$or": [{"product_id": p, "warehouse_id": w, "bin_id": b} for p, w, b in keys]},
+        {"_id": 0, "product_id": 1, "warehouse_id": 1, "bin_id": 1, "quantity": 1},
+        session=session
+    ).to_list(None)
+    return {(row["product_id"], row["warehouse_id"], row.get("bin_id")): row["quantity"] for row in rows}
+
+
+def admit_stock_moves(moves: List[StockMove], available: dict) -> tuple:
+    """
+    Walk the moves in order, admitting each one whose debit fits the quantity left on
+    its row after the lines admitted before it (their credits count too).
+    Returns (admitted moves, {move id: shortfall detail} for the rest).
+    """
+    available = dict(available)
+    admitted = []
+    shortfall_by_line = {}
+    for move in moves:
+        legs = [((move.product_id, warehouse_id, bin_id), change) for warehouse_id, bin_id, change in inventory_legs(move)]
+        short = next((key for key, change in legs if change < 0 and available.get(key, 0.0) < -change), None)
+        if short:
+            shortfall_by_line[move.id] = insufficient_stock_detail(*short, move.quantity)
+            continue
+        for key, change in legs:
+            available[key] = available.get(key, 0.0) + change
+        admitted.append(move)
+    return admitted, shortfall_by_line
+
+
+async def debit_inventory_deltas(deltas: dict, session=None) -> List[dict]:
+    """
+    Apply the net debits in `deltas` as conditional decrements. If any key is short,
+    the debits already applied are undone and the shortfalls are returned, so the
+    caller can re-admit its lines and try again in the same session.
+    """
+    applied = []
+    shortfalls = []
+    for (product_id, warehouse_id, bin_id), quantity_change in deltas.items():
+        if quantity_change >= 0:
+            continue
+        if await debit_inventory(product_id, warehouse_id, bin_id, -quantity_change, session=session):
+            applied.append((product_id, warehouse_id, bin_id, -quantity_change))
+        else:
+            shortfalls.append(insufficient_stock_detail(product_id, warehouse_id, bin_id, -quantity_change))
+    
+    if shortfalls:
+        for product_id, warehouse_id, bin_id, quantity in applied:
+            await update_inventory(product_id, warehouse_id, bin_id, quantity, session=session)
+    return shortfalls
+
+
+async def apply_inventory_deltas(deltas: dict, session=None):
+    """
+    Apply folded deltas as one unordered bulk_write of $inc upserts, without a stock
+    check (debits that must not overdraw go through debit_inventory_deltas first).
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    writes = [
+        (
+            {"product_id": product_id, "warehouse_id": warehouse_id, "bin_id": bin_id},
+            {
+                "$inc": {"quantity": quantity_change},
+                "$set": {"last_updated": now},
+                "$setOnInsert": {"id": str(uuid.uuid4())}
+            }
         )
-    else:
-        inventory_item = InventoryItem(
-            product_id=product_id,
-            warehouse_id=warehouse_id,
-            bin_id=bin_id,
-            quantity=quantity_change
+        for (product_id, warehouse_id, bin_id), quantity_change in deltas.items()
+        if quantity_change != 0
+    ]
+    if not writes:
+        return
+    
+    try:
+        await db.inventory_items.bulk_write(
+            [UpdateOne(query, update, upsert=True) for query, update in writes], ordered=False, session=session
         )
-        await db.inventory_items.insert_one(inventory_item.model_dump())
+    except BulkWriteError as e:
+        # Inside a transaction the write error aborts it; run_in_transaction reruns the callback
+        if session or not is_duplicate_key_error(e):
+            raise
+        # Upserts raced other moves to create these rows; the unordered batch applied everything
+        # else, so only the losers retry, as plain updates (same as update_inventory)
+        for error in e.details["writeErrors"]:
+            query, update = writes[error["index"]]
+            await db.inventory_items.update_one(query, update)
 
 
 # Authentication Endpoints
@@ -369,7 +818,7 @@ async def register(user_data: UserCreate):
     # Create user
     user = User(
         email=user_data.email,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password(user_data.password),
         name=user_data.name,
         phone=user_data.phone,
         role=user_data.role
@@ -391,7 +840,7 @@ async def login(credentials: UserLogin, response: Response):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(credentials.password, user["password_hash"]):
+    if not user.get("password_hash") or not await verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_obj = User(**user)
@@ -525,12 +974,7 @@ async def get_session_data(request: Request):
     if session_id:
         # Call Emergent auth service
         try:
-            response = requests.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = await oauth_client.get_session_data(session_id)
             
             # Check if user exists
             user = await db.users.find_one({"email": data["email"]}, {"_id": 0})
@@ -550,14 +994,19 @@ async def get_session_data(request: Request):
             
             user_obj = User(**user)
             
-            # Create session with Emergent session_token
+            # Create session with Emergent session_token (upsert, the exchange may be replayed from cache)
             session = UserSession(
                 user_id=user_obj.id,
                 session_token=data["session_token"],
                 expires_at=datetime.now(timezone.utc) + timedelta(days=7)
             )
+            session_data = session.model_dump()
             
-            await db.user_sessions.insert_one(session.model_dump())
+            await db.user_sessions.update_one(
+                {"session_token": session.session_token},
+                {"$setOnInsert": session_data},
+                upsert=True
+            )
             
             return {
                 "session_token": data["session_token"],
@@ -591,10 +1040,11 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 
 @api_router.post("/auth/logout")
 async def logout(request: Request, response: Response, current_user: User = Depends(get_current_user)):
-    session_token = request.cookies.get("session_token")
+    session_token = get_session_token(request)
     
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        session_cache.invalidate_session(session_token)
     
     response.delete_cookie(key="session_token", path="/")
     
@@ -610,15 +1060,27 @@ async def toggle_2fa(enable: bool, current_user: User = Depends(get_current_user
         {"id": current_user.id},
         {"$set": {"otp_enabled": enable}}
     )
+    session_cache.invalidate_user(current_user.id)
     
     return {"message": f"2FA {'enabled' if enable else 'disabled'} successfully"}
 
 
 # User Management (Admin only)
-@api_router.get("/users", response_model=List[User])
-async def get_users(current_user: User = Depends(check_permission([UserRole.ADMIN]))):
-    users = await db.users.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
-    return users
+@api_router.get("/users")
+async def get_users(
+    response: Response,
+    role: Optional[UserRole] = None,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(check_permission([UserRole.ADMIN]))
+):
+    query = {}
+    if role:
+        query["role"] = role
+    if is_active is not None:
+        query["is_active"] = is_active
+    
+    return await paginate(db.users, query, response, page, direction=ASCENDING, exclude=("password_hash",))
 
 
 @api_router.patch("/users/{user_id}/role")
@@ -631,6 +1093,7 @@ async def update_user_role(user_id: str, role: UserRole, current_user: User = De
         {"id": user_id},
         {"$set": {"role": role}}
     )
+    session_cache.invalidate_user(user_id)
     
     await log_audit(current_user.id, current_user.email, AuditAction.UPDATE, "user", user_id,
                    before_data={"role": user["role"]}, after_data={"role": role})
@@ -638,11 +1101,34 @@ async def update_user_role(user_id: str, role: UserRole, current_user: User = De
     return {"message": "Role updated successfully"}
 
 
+@api_router.patch("/users/{user_id}/status")
+async def update_user_status(user_id: str, is_active: bool, current_user: User = Depends(check_permission([UserRole.ADMIN]))):
+    user = await db.users.find_one({"id": user_id})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await db.users.update_one(
+        {"id": user_id},
+        {"$set": {"is_active": is_active}}
+    )
+    session_cache.invalidate_user(user_id)
+    
+    await log_audit(current_user.id, current_user.email, AuditAction.UPDATE, "user", user_id,
+                   before_data={"is_active": user.get("is_active", True)}, after_data={"is_active": is_active})
+    
+    return {"message": f"User {'activated' if is_active else 'deactivated'} successfully"}
+
+
 # Audit Logs
 @api_router.get("/audit-logs")
 async def get_audit_logs(
+    response: Response,
     resource_type: Optional[str] = None,
     user_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    month: Optional[str] = None,
+    page: PageParams = Depends(),
     current_user: User = Depends(check_permission([UserRole.ADMIN, UserRole.ACCOUNTANT, UserRole.CEO_VIEWER]))
 ):
     query = {}
@@ -651,8 +1137,43 @@ async def get_audit_logs(
     if user_id:
         query["user_id"] = user_id
     
-    logs = await db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).to_list(1000)
-    return logs
+    date_filter = date_range_query(start_date, end_date)
+    if date_filter:
+        query["timestamp"] = date_filter
+    
+    # Rolled-over months live in their own audit_logs_YYYY_MM collection
+    if month:
+        try:
+            collection = db[AuditLogService.archive_collection_name(month)]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        collection = db.audit_logs
+        # Make buffered records visible to the query
+        await audit_buffer.flush()
+    
+    return await paginate(collection, query, response, page, sort_field="timestamp")
+
+
+@api_router.get("/audit-logs/metrics")
+async def get_audit_log_metrics(current_user: User = Depends(check_permission([UserRole.ADMIN]))):
+    return audit_buffer.metrics()
+
+
+@api_router.get("/audit-logs/archives")
+async def get_audit_log_archives(
+    current_user: User = Depends(check_permission([UserRole.ADMIN, UserRole.ACCOUNTANT, UserRole.CEO_VIEWER]))
+):
+    return {"months": await AuditLogService.list_archives(db)}
+
+
+@api_router.post("/audit-logs/rollover")
+async def rollover_audit_logs(
+    keep_months: int = Query(3, ge=1),
+    current_user: User = Depends(check_permission([UserRole.ADMIN]))
+):
+    await audit_buffer.flush()
+    return await AuditLogService.rollover(db, keep_months)
 
 
 # Product endpoints (with auth and audit)
@@ -673,10 +1194,17 @@ async def create_product(product: ProductCreate, current_user: User = Depends(ch
     return product_obj
 
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(current_user: User = Depends(get_current_user)):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    return products
+@api_router.get("/products")
+async def get_products(
+    response: Response,
+    code: Optional[str] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if code:
+        query["code"] = code
+    return await paginate(db.products, query, response, page, direction=ASCENDING)
 
 
 @api_router.get("/products/{product_id}", response_model=Product)
@@ -705,10 +1233,17 @@ async def create_warehouse(warehouse: WarehouseCreate, current_user: User = Depe
     return warehouse_obj
 
 
-@api_router.get("/warehouses", response_model=List[Warehouse])
-async def get_warehouses(current_user: User = Depends(get_current_user)):
-    warehouses = await db.warehouses.find({}, {"_id": 0}).to_list(1000)
-    return warehouses
+@api_router.get("/warehouses")
+async def get_warehouses(
+    response: Response,
+    code: Optional[str] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if code:
+        query["code"] = code
+    return await paginate(db.warehouses, query, response, page, direction=ASCENDING)
 
 
 # Bin endpoints (with auth and audit)
@@ -729,20 +1264,26 @@ async def create_bin(bin_data: BinCreate, current_user: User = Depends(check_per
     return bin_obj
 
 
-@api_router.get("/bins", response_model=List[Bin])
-async def get_bins(warehouse_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+@api_router.get("/bins")
+async def get_bins(
+    response: Response,
+    warehouse_id: Optional[str] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
     query = {}
     if warehouse_id:
         query["warehouse_id"] = warehouse_id
-    bins = await db.bins.find(query, {"_id": 0}).to_list(1000)
-    return bins
+    return await paginate(db.bins, query, response, page, direction=ASCENDING)
 
 
 # Inventory endpoints (with auth)
 @api_router.get("/inventory")
 async def get_inventory(
+    response: Response,
     product_id: Optional[str] = None,
     warehouse_id: Optional[str] = None,
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user)
 ):
     query = {}
@@ -751,21 +1292,71 @@ async def get_inventory(
     if warehouse_id:
         query["warehouse_id"] = warehouse_id
     
-    inventory = await db.inventory_items.find(query, {"_id": 0}).to_list(1000)
+    # last_updated changes on every move, so it cannot be a keyset; id never changes
+    inventory = await paginate(db.inventory_items, query, response, page, sort_field="id", direction=ASCENDING)
+    
+    # Prefetch all referenced masters with one $in query per collection and join in memory
+    product_ids = list({item["product_id"] for item in inventory if item.get("product_id")})
+    warehouse_ids = list({item["warehouse_id"] for item in inventory if item.get("warehouse_id")})
+    bin_ids = list({item["bin_id"] for item in inventory if item.get("bin_id")})
+    
+    products, warehouses, bins = await asyncio.gather(
+        db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(None),
+        db.warehouses.find({"id": {"$in": warehouse_ids}}, {"_id": 0}).to_list(None),
+        db.bins.find({"id": {"$in": bin_ids}}, {"_id": 0}).to_list(None)
+    )
+    products_by_id = {p["id"]: p for p in products}
+    warehouses_by_id = {w["id"]: w for w in warehouses}
+    bins_by_id = {b["id"]: b for b in bins}
     
     for item in inventory:
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
-        warehouse = await db.warehouses.find_one({"id": item["warehouse_id"]}, {"_id": 0})
-        item["product"] = product
-        item["warehouse"] = warehouse
+        item["product"] = products_by_id.get(item.get("product_id"))
+        item["warehouse"] = warehouses_by_id.get(item.get("warehouse_id"))
         
         if item.get("bin_id"):
-            bin_data = await db.bins.find_one({"id": item["bin_id"]}, {"_id": 0})
-            item["bin"] = bin_data
+            item["bin"] = bins_by_id.get(item["bin_id"])
     
     return inventory
 
 
+# Stock snapshots (historical balances and drift detection)
+@api_router.post("/inventory/snapshots")
+async def create_stock_snapshot(current_user: User = Depends(check_permission([UserRole.ADMIN, UserRole.ACCOUNTANT]))):
+    return await StockSnapshotService.take_snapshot(db)
+
+
+@api_router.get("/inventory/snapshots")
+async def get_stock_snapshots(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    return await paginate(db.stock_snapshots, {}, response, page, sort_field="as_of")
+
+
+@api_router.get("/inventory/as-of")
+async def get_inventory_as_of(
+    date: str,
+    product_id: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    # Same bound semantics as list filters: a plain date means end of that day
+    as_of = date_range_query(None, date)
+    return await StockSnapshotService.balances_as_of(
+        db, as_of.get("$lte") or as_of["$lt"], product_id, warehouse_id
+    )
+
+
+@api_router.get("/inventory/drift")
+async def get_inventory_drift(
+    product_id: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    current_user: User = Depends(check_permission([UserRole.ADMIN, UserRole.ACCOUNTANT, UserRole.INVENTORY_OFFICER]))
+):
+    return await StockSnapshotService.detect_drift(db, product_id, warehouse_id)
+
+
 # Stock move endpoints (with auth and audit)
 @api_router.post("/stock-moves", response_model=StockMove)
 async def create_stock_move(move: StockMoveCreate, current_user: User = Depends(check_permission(
@@ -776,16 +1367,16 @@ async def create_stock_move(move: StockMoveCreate, current_user: User = Depends(
         raise HTTPException(status_code=404, detail="Product not found")
     
     move_obj = StockMove(**move.model_dump())
-    await db.stock_moves.insert_one(move_obj.model_dump())
     
-    # Update inventory based on move type
-    if move.move_type == StockMoveType.RECEIPT:
-        await update_inventory(move.product_id, move.to_warehouse_id, move.to_bin_id, move.quantity)
-    elif move.move_type == StockMoveType.ISSUE:
-        await update_inventory(move.product_id, move.from_warehouse_id, move.from_bin_id, -move.quantity)
-    elif move.move_type == StockMoveType.TRANSFER:
-        await update_inventory(move.product_id, move.from_warehouse_id, move.from_bin_id, -move.quantity)
-        await update_inventory(move.product_id, move.to_warehouse_id, move.to_bin_id, move.quantity)
+    # The move and its inventory effect are committed together or not at all
+    # Debits run first and are conditional, so a shortfall aborts before anything else is written
+    async def post(session):
+        for warehouse_id, bin_id, quantity_change in inventory_legs(move_obj):
+            await update_inventory(move.product_id, warehouse_id, bin_id, quantity_change,
+                                   session=session, enforce_available=True)
+        await db.stock_moves.insert_one(move_obj.model_dump(), session=session)
+    
+    await run_in_transaction(post)
     
     await log_audit(current_user.id, current_user.email, AuditAction.CREATE, "stock_move", move_obj.id,
                    after_data=move_obj.model_dump())
@@ -793,13 +1384,143 @@ async def create_stock_move(move: StockMoveCreate, current_user: User = Depends(
     return move_obj
 
 
-@api_router.get("/stock-moves", response_model=List[StockMove])
-async def get_stock_moves(product_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+@api_router.post("/stock-moves/bulk")
+async def create_stock_moves_bulk(payload: StockMoveBulkCreate, current_user: User = Depends(check_permission(
+    [UserRole.ADMIN, UserRole.INVENTORY_OFFICER]
+))):
+    moves = payload.moves
+    
+    # Validate every product/warehouse reference with one $in query per collection
+    product_ids = list({move.product_id for move in moves})
+    warehouse_ids = list({
+        warehouse_id
+        for move in moves
+        for warehouse_id in (move.from_warehouse_id, move.to_warehouse_id)
+        if warehouse_id
+    })
+    products, warehouses = await asyncio.gather(
+        db.products.find({"id": {"$in": product_ids}}, {"_id": 0, "id": 1}).to_list(None),
+        db.warehouses.find({"id": {"$in": warehouse_ids}}, {"_id": 0, "id": 1}).to_list(None)
+    )
+    known_products = {p["id"] for p in products}
+    known_warehouses = {w["id"] for w in warehouses}
+    
+    results = []
+    valid_moves = []
+    for index, move in enumerate(moves):
+        move_obj = StockMove(**move.model_dump())
+        error = None
+        if move.product_id not in known_products:
+            error = "Product not found"
+        elif move.quantity <= 0:
+            error = "Quantity must be positive"
+        else:
+            for warehouse_id, bin_id, quantity_change in inventory_legs(move_obj):
+                if not warehouse_id:
+                    error = f"Warehouse required for {move.move_type.value}"
+                    break
+                if warehouse_id not in known_warehouses:
+                    error = f"Warehouse {warehouse_id} not found"
+                    break
+        
+        if error:
+            results.append({"index": index, "status": "error", "error": error})
+        else:
+            valid_moves.append(move_obj)
+            results.append({"index": index, "status": "created", "id": move_obj.id})
+    
+    posted_moves = []
+    if valid_moves:
+        async def post(session):
+            # Reset on every attempt: with_transaction may rerun the callback
+            posted_moves.clear()
+            while True:
+                # Admit lines in order against the stock on hand, so a short row still
+                # posts the lines that fit before it runs out
+                available = await load_inventory_quantities(
+                    {key for move_obj in valid_moves for key in inventory_debit_keys(move_obj)}, session=session
+                )
+                admitted, shortfall_by_line = admit_stock_moves(valid_moves, available)
+                deltas = fold_inventory_deltas(admitted)
+                if not await debit_inventory_deltas(deltas, session=session):
+                    break
+                # Without a transaction, other moves debited the rows after they were read; admit again
+            
+            if admitted:
+                await apply_inventory_deltas(
+                    {key: change for key, change in deltas.items() if change > 0}, session=session
+                )
+                await db.stock_moves.insert_many([m.model_dump() for m in admitted], session=session)
+            posted_moves.extend(admitted)
+            return shortfall_by_line
+        
+        shortfall_by_line = await run_in_transaction(post)
+        
+        explained = {}
+        for result in results:
+            shortfall = shortfall_by_line.get(result.get("id"))
+            if shortfall:
+                key = (shortfall["product_id"], shortfall["warehouse_id"], shortfall["bin_id"])
+                if key not in explained:
+                    explained[key] = await explain_warehouse_shortfall(dict(shortfall))
+                shortfall = {**explained[key], "requested": shortfall["requested"]}
+                del result["id"]
+                result.update({"status": "error", "error": shortfall["message"], "shortfall": shortfall})
+        
+        for move_obj in posted_moves:
+            await log_audit(current_user.id, current_user.email, AuditAction.CREATE, "stock_move", move_obj.id,
+                           after_data=move_obj.model_dump())
+    
+    return {
+        "created": len(posted_moves),
+        "failed": len(moves) - len(posted_moves),
+        "results": results
+    }
+
+
+@api_router.get("/stock-moves")
+async def get_stock_moves(
+    response: Response,
+    product_id: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    bin_id: Optional[str] = None,
+    move_type: Optional[StockMoveType] = None,
+    reference: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    conditions = []
     if product_id:
-        query["product_id"] = product_id
-    moves = await db.stock_moves.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return moves
+        conditions.append({"product_id": product_id})
+    if move_type:
+        conditions.append({"move_type": move_type})
+    if reference:
+        conditions.append({"reference": reference})
+    # A warehouse/bin matches either side of the move; each branch has its own index
+    if warehouse_id:
+        conditions.append({"$or": [{"from_warehouse_id": warehouse_id}, {"to_warehouse_id": warehouse_id}]})
+    if bin_id:
+        conditions.append({"$or": [{"from_bin_id": bin_id}, {"to_bin_id": bin_id}]})
+    
+    date_filter = date_range_query(start_date, end_date)
+    if date_filter:
+        conditions.append({"created_at": date_filter})
+    
+    query = {"$and": conditions} if len(conditions) > 1 else (conditions[0] if conditions else {})
+    direction = ASCENDING if order == "asc" else DESCENDING
+    
+    if format == "ndjson":
+        # Full history, streamed from the cursor without materializing it
+        cursor = db.stock_moves.find(query, build_projection(page.fields, "created_at")) \
+            .sort([("created_at", direction), ("id", direction)]) \
+            .batch_size(1000)
+        return StreamingResponse(ndjson_stream(cursor), media_type="application/x-ndjson")
+    
+    return await paginate(db.stock_moves, query, response, page, direction=direction)
 
 
 # Adjustment endpoints (with auth and audit)
@@ -816,15 +1537,6 @@ async def create_adjustment(adjustment: AdjustmentCreate, current_user: User = D
         raise HTTPException(status_code=404, detail="Warehouse not found")
     
     adjustment_obj = Adjustment(**adjustment.model_dump())
-    await db.adjustments.insert_one(adjustment_obj.model_dump())
-    
-    # Update inventory
-    await update_inventory(
-        adjustment.product_id,
-        adjustment.warehouse_id,
-        adjustment.bin_id,
-        adjustment.quantity_change
-    )
     
     # Create stock move for tracking
     stock_move = StockMove(
@@ -838,7 +1550,19 @@ async def create_adjustment(adjustment: AdjustmentCreate, current_user: User = D
         reference=adjustment_obj.id,
         notes=adjustment.reason
     )
-    await db.stock_moves.insert_one(stock_move.model_dump())
+    
+    async def post(session):
+        await db.adjustments.insert_one(adjustment_obj.model_dump(), session=session)
+        await update_inventory(
+            adjustment.product_id,
+            adjustment.warehouse_id,
+            adjustment.bin_id,
+            adjustment.quantity_change,
+            session=session
+        )
+        await db.stock_moves.insert_one(stock_move.model_dump(), session=session)
+    
+    await run_in_transaction(post)
     
     await log_audit(current_user.id, current_user.email, AuditAction.CREATE, "adjustment", adjustment_obj.id,
                    after_data=adjustment_obj.model_dump())
@@ -846,10 +1570,20 @@ async def create_adjustment(adjustment: AdjustmentCreate, current_user: User = D
     return adjustment_obj
 
 
-@api_router.get("/adjustments", response_model=List[Adjustment])
-async def get_adjustments(current_user: User = Depends(get_current_user)):
-    adjustments = await db.adjustments.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return adjustments
+@api_router.get("/adjustments")
+async def get_adjustments(
+    response: Response,
+    product_id: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if product_id:
+        query["product_id"] = product_id
+    if warehouse_id:
+        query["warehouse_id"] = warehouse_id
+    return await paginate(db.adjustments, query, response, page)
 
 
 # ===== MASTERS ENDPOINTS =====
@@ -879,10 +1613,20 @@ async def create_bom(bom: BOMCreate, current_user: User = Depends(check_permissi
     return bom_obj
 
 
-@api_router.get("/boms", response_model=List[BOM])
-async def get_boms(current_user: User = Depends(get_current_user)):
-    boms = await db.boms.find({}, {"_id": 0}).to_list(1000)
-    return boms
+@api_router.get("/boms")
+async def get_boms(
+    response: Response,
+    product_id: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if product_id:
+        query["product_id"] = product_id
+    if is_active is not None:
+        query["is_active"] = is_active
+    return await paginate(db.boms, query, response, page, direction=ASCENDING)
 
 
 @api_router.get("/boms/{bom_id}", response_model=BOM)
@@ -911,10 +1655,17 @@ async def create_work_center(work_center: WorkCenterCreate, current_user: User =
     return wc_obj
 
 
-@api_router.get("/work-centers", response_model=List[WorkCenter])
-async def get_work_centers(current_user: User = Depends(get_current_user)):
-    work_centers = await db.work_centers.find({}, {"_id": 0}).to_list(1000)
-    return work_centers
+@api_router.get("/work-centers")
+async def get_work_centers(
+    response: Response,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if is_active is not None:
+        query["is_active"] = is_active
+    return await paginate(db.work_centers, query, response, page, direction=ASCENDING)
 
 
 # Employee endpoints
@@ -935,10 +1686,20 @@ async def create_employee(employee: EmployeeCreate, current_user: User = Depends
     return emp_obj
 
 
-@api_router.get("/employees", response_model=List[Employee])
-async def get_employees(current_user: User = Depends(get_current_user)):
-    employees = await db.employees.find({}, {"_id": 0}).to_list(1000)
-    return employees
+@api_router.get("/employees")
+async def get_employees(
+    response: Response,
+    department: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if department:
+        query["department"] = department
+    if is_active is not None:
+        query["is_active"] = is_active
+    return await paginate(db.employees, query, response, page, direction=ASCENDING)
 
 
 # Supplier endpoints
@@ -959,10 +1720,17 @@ async def create_supplier(supplier: SupplierCreate, current_user: User = Depends
     return supp_obj
 
 
-@api_router.get("/suppliers", response_model=List[Supplier])
-async def get_suppliers(current_user: User = Depends(get_current_user)):
-    suppliers = await db.suppliers.find({}, {"_id": 0}).to_list(1000)
-    return suppliers
+@api_router.get("/suppliers")
+async def get_suppliers(
+    response: Response,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if is_active is not None:
+        query["is_active"] = is_active
+    return await paginate(db.suppliers, query, response, page, direction=ASCENDING)
 
 
 # Customer endpoints
@@ -983,10 +1751,218 @@ async def create_customer(customer: CustomerCreate, current_user: User = Depends
     return cust_obj
 
 
-@api_router.get("/customers", response_model=List[Customer])
-async def get_customers(current_user: User = Depends(get_current_user)):
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
-    return customers
+@api_router.get("/customers")
+async def get_customers(
+    response: Response,
+    is_active: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    if is_active is not None:
+        query["is_active"] = is_active
+    return await paginate(db.customers, query, response, page, direction=ASCENDING)
+
+
+# Data export (streamed, so large collections are exported completely with flat memory)
+@api_router.post("/export")
+async def export_data(request: ExportRequest, current_user: User = Depends(check_permission(
+    [UserRole.ADMIN, UserRole.ACCOUNTANT]
+))):
+    streams = {
+        "csv": ExportService.stream_csv,
+        "json": ExportService.stream_json,
+        "ndjson": ExportService.stream_ndjson
+    }
+    try:
+        ExportService.validate_request(request.entity, request.filters)
+        if request.format == "excel":
+            # XLSX is a zip and can only be sent once complete; it is spooled to a temp file, not RAM
+            excel_path = await ExportService.export_to_excel_file(db, request.entity, request.filters)
+        elif request.format not in streams:
+            raise ValueError(f"Unsupported export format: {request.format}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"{request.entity}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.{ExportService.FILE_EXTENSIONS[request.format]}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = ExportService.MEDIA_TYPES[request.format]
+    
+    if request.format == "excel":
+        return FileResponse(
+            excel_path,
+            media_type=media_type,
+            headers=headers,
+            background=BackgroundTask(os.unlink, excel_path)
+        )
+    
+    return StreamingResponse(
+        streams[request.format](db, request.entity, request.filters),
+        media_type=media_type,
+        headers=headers
+    )
+
+
+# Background export jobs (large exports without holding a request open)
+@api_router.post("/export/jobs")
+async def submit_export_job(request: ExportRequest, current_user: User = Depends(check_permission(
+    [UserRole.ADMIN, UserRole.ACCOUNTANT]
+))):
+    try:
+        return await export_job_manager.submit(request, current_user.id)
+    except ExportJobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@api_router.get("/export/jobs")
+async def get_export_jobs(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: User = Depends(check_permission([UserRole.ADMIN, UserRole.ACCOUNTANT]))
+):
+    return await paginate(db.export_jobs, {"user_id": current_user.id}, response, page)
+
+
+async def get_owned_export_job(job_id: str, current_user: User) -> dict:
+    job = await export_job_manager.get(job_id)
+    if not job or (job["user_id"] != current_user.id and current_user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+
+@api_router.get("/export/jobs/{job_id}")
+async def get_export_job(job_id: str, current_user: User = Depends(check_permission(
+    [UserRole.ADMIN, UserRole.ACCOUNTANT]
+))):
+    return await get_owned_export_job(job_id, current_user)
+
+
+@api_router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, request: Request, current_user: User = Depends(check_permission(
+    [UserRole.ADMIN, UserRole.ACCOUNTANT]
+))):
+    job = await get_owned_export_job(job_id, current_user)
+    if job["status"] == "expired":
+        raise HTTPException(status_code=410, detail="Export artifact has expired")
+    
+    path = export_job_manager.artifact_path(job)
+    if job["status"] != "completed" or not os.path.exists(path):
+        raise HTTPException(status_code=409, detail=f"Export job is {job['status']}")
+    
+    size = os.path.getsize(path)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{job["file_name"]}"',
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{job_id}-{size}"'
+    }
+    
+    # Resume support: honour Range only when If-Range (if sent) still matches this artifact
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers["ETag"]:
+        range_header = None
+    
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    
+    media_type = ExportService.MEDIA_TYPES[job["format"]]
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_file_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+# Streaming, validated file import: entity -> (model rows are validated against, roles allowed to import)
+IMPORT_REPORT_DIR = os.environ.get('IMPORT_REPORT_DIR', '/app/import_reports')
+IMPORTABLE_ENTITIES = {
+    "products": (Product, [UserRole.ADMIN, UserRole.PRODUCTION_MANAGER, UserRole.INVENTORY_OFFICER]),
+    "warehouses": (Warehouse, [UserRole.ADMIN, UserRole.INVENTORY_OFFICER]),
+    "bins": (Bin, [UserRole.ADMIN, UserRole.INVENTORY_OFFICER]),
+    "boms": (BOM, [UserRole.ADMIN, UserRole.PRODUCTION_MANAGER]),
+    "work_centers": (WorkCenter, [UserRole.ADMIN, UserRole.PRODUCTION_MANAGER]),
+    "employees": (Employee, [UserRole.ADMIN, UserRole.HR_OFFICER]),
+    "suppliers": (Supplier, [UserRole.ADMIN, UserRole.PRODUCTION_MANAGER, UserRole.ACCOUNTANT]),
+    "customers": (Customer, [UserRole.ADMIN, UserRole.PRODUCTION_MANAGER, UserRole.ACCOUNTANT]),
+}
+
+
+@api_router.post("/import/{entity}")
+async def import_data(
+    entity: str,
+    file: UploadFile = File(...),
+    mode: str = Form("append"),
+    current_user: User = Depends(get_current_user)
+):
+    if entity not in IMPORTABLE_ENTITIES:
+        raise HTTPException(status_code=400, detail=f"Entity {entity} not supported for import")
+    model, roles = IMPORTABLE_ENTITIES[entity]
+    if current_user.role not in roles:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    try:
+        file_format = ImportService.detect_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    import_id = str(uuid.uuid4())
+    os.makedirs(IMPORT_REPORT_DIR, exist_ok=True)
+    error_path = os.path.join(IMPORT_REPORT_DIR, f"{import_id}.errors.csv")
+    
+    # UploadFile spools large uploads to disk; rows are read from it in chunks
+    try:
+        summary = await ImportService.import_stream(db, entity, file.file, file_format, model, mode, error_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    run = {
+        "id": import_id,
+        "entity": entity,
+        "mode": mode,
+        "file_name": file.filename,
+        "user_id": current_user.id,
+        **summary,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.import_runs.insert_one(dict(run))
+    await log_audit(current_user.id, current_user.email, AuditAction.CREATE, "import", import_id,
+                   after_data={"entity": entity, "inserted": summary["inserted"], "updated": summary["updated"]})
+    
+    return run
+
+
+@api_router.get("/import/{import_id}/errors")
+async def download_import_errors(import_id: str, current_user: User = Depends(get_current_user)):
+    run = await db.import_runs.find_one({"id": import_id}, {"_id": 0})
+    if not run or (run["user_id"] != current_user.id and current_user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Import not found")
+    
+    error_path = os.path.join(IMPORT_REPORT_DIR, f"{import_id}.errors.csv")
+    if not run.get("has_error_report") or not os.path.exists(error_path):
+        raise HTTPException(status_code=404, detail="No error report for this import")
+    
+    return FileResponse(
+        error_path,
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{run["entity"]}_import_errors.csv"'}
+    )
+
+
+# Index maintenance (Admin only)
+@api_router.get("/admin/indexes")
+async def get_index_report(current_user: User = Depends(check_permission([UserRole.ADMIN]))):
+    return await IndexService.report(db)
+
+
+@api_router.post("/admin/indexes")
+async def apply_indexes(current_user: User = Depends(check_permission([UserRole.ADMIN]))):
+    return await IndexService.ensure_indexes(db)
 
 
 @api_router.get("/")
@@ -997,12 +1973,20 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+
+@app.exception_handler(DuplicateKeyError)
+async def duplicate_key_handler(request: Request, exc: DuplicateKeyError):
+    # Unique indexes close the race between the duplicate checks and the insert
+    return JSONResponse(status_code=409, content={"detail": "Duplicate record"})
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Range", "Content-Disposition"],
 )
 
 # Configure logging
@@ -1012,6 +1996,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    audit_buffer.start()
+    if sms_dispatcher:
+        sms_dispatcher.start()
+    export_job_manager.start()
+    await export_job_manager.requeue_pending()
+    webhook_dispatcher.start()
+    try:
+        await subscription_routes.load(db)
+    except Exception as e:
+        # trigger_event queries subscriptions directly until the table is loaded
+        logger.error(f"Failed to load webhook routes: {e}")
+    subscription_routes.start(db)
+    
+    snapshot_interval_hours = float(os.environ.get('STOCK_SNAPSHOT_INTERVAL_HOURS', '0'))
+    if snapshot_interval_hours > 0:
+        background_tasks.append(asyncio.create_task(
+            StockSnapshotService.run_periodically(db, snapshot_interval_hours * 3600)
+        ))
+
+
+@app.on_event("startup")
+async def create_indexes():
+    result = await IndexService.ensure_indexes(db)
+    logger.info(f"Applied {result['indexes_applied']} indexes ({len(result['errors'])} errors)")
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    if sms_dispatcher:
+        await sms_dispatcher.stop()
+    await export_job_manager.stop()
+    await webhook_dispatcher.stop()
+    await subscription_routes.stop()
+    await audit_buffer.stop()
     client.close()
+    password_executor.shutdown(wait=False)
+    await oauth_client.close()
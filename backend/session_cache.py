@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+import time
+
+
+class SessionCache:
+    """In-process TTL/LRU cache of validated session tokens and their users"""
+
+    def __init__(self, ttl_seconds: float = 30.0, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # session_token -> (cached_at, session_expires_at, user)
+        self._entries: "OrderedDict[str, Tuple[float, datetime, Any]]" = OrderedDict()
+        # user_id -> session tokens, so role/2FA/deactivation changes can evict them
+        self._tokens_by_user: Dict[str, set] = {}
+
+    def get(self, session_token: str) -> Optional[Any]:
+        """Return the cached user for a token, or None on miss/expiry"""
+        entry = self._entries.get(session_token)
+        if not entry:
+            return None
+
+        cached_at, expires_at, user = entry
+        if time.monotonic() - cached_at > self.ttl_seconds or expires_at < datetime.now(timezone.utc):
+            self._remove(session_token)
+            return None
+
+        self._entries.move_to_end(session_token)
+        return user
+
+    def set(self, session_token: str, expires_at: datetime, user: Any):
+        if self.ttl_seconds <= 0:
+            return
+
+        self._remove(session_token)
+        self._entries[session_token] = (time.monotonic(), expires_at, user)
+        self._tokens_by_user.setdefault(user.id, set()).add(session_token)
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_session(self, session_token: str):
+        self._remove(session_token)
+
+    def invalidate_user(self, user_id: str):
+        for session_token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(session_token)
+
+    def _remove(self, session_token: str):
+        entry = self._entries.pop(session_token, None)
+        if not entry:
+            return
+
+        user_id = entry[2].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens:
+            tokens.discard(session_token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
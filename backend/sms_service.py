@@ -0,0 +1,125 @@
+from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+class SMSTransport:
+    """Base class for outbound SMS transports"""
+
+    async def send(self, to: str, body: str):
+        raise NotImplementedError
+
+
+class TwilioSMSTransport(SMSTransport):
+    """Sends through Twilio; the blocking SDK call runs in a worker thread"""
+
+    def __init__(self, client, from_number: str):
+        self.client = client
+        self.from_number = from_number
+
+    async def send(self, to: str, body: str):
+        await asyncio.to_thread(
+            self.client.messages.create,
+            body=body,
+            from_=self.from_number,
+            to=to
+        )
+
+
+class FakeSMSTransport(SMSTransport):
+    """Records messages in memory instead of sending them (local/dev/tests)"""
+
+    def __init__(self):
+        self.sent: List[Dict[str, str]] = []
+
+    async def send(self, to: str, body: str):
+        self.sent.append({"to": to, "body": body})
+        logger.info(f"[fake sms] to={to}: {body}")
+
+
+class SMSDispatcher:
+    """Outbound SMS queue drained by a background sender with batching and retry/backoff"""
+
+    def __init__(
+        self,
+        transport: SMSTransport,
+        batch_size: int = 20,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 1.0,
+        max_queue_size: int = 10000
+    ):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._retry_tasks: set = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def enqueue(self, to: str, body: str) -> bool:
+        """Queue a message for delivery; returns False if the queue is full"""
+        try:
+            self._queue.put_nowait({"to": to, "body": body, "attempts": 0})
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"SMS queue full, dropping message to {to}")
+            return False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Give queued messages a chance to go out, then stop the sender"""
+        if self._task is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"SMS queue not drained on shutdown ({self.queue_depth} pending)")
+
+        for task in list(self._retry_tasks) + [self._task]:
+            task.cancel()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await asyncio.gather(*(self._deliver(message) for message in batch))
+
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _deliver(self, message: Dict[str, Any]):
+        try:
+            await self.transport.send(message["to"], message["body"])
+        except Exception as e:
+            message["attempts"] += 1
+            if message["attempts"] >= self.max_attempts:
+                logger.error(f"Failed to send SMS to {message['to']} after {message['attempts']} attempts: {e}")
+                return
+
+            # Exponential backoff with jitter
+            delay = self.base_backoff_seconds * (2 ** (message["attempts"] - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"SMS to {message['to']} failed (attempt {message['attempts']}), retrying in {delay:.1f}s: {e}")
+            task = asyncio.create_task(self._retry_later(message, delay))
+            self._retry_tasks.add(task)
+            task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry_later(self, message: Dict[str, Any], delay: float):
+        await asyncio.sleep(delay)
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.error(f"SMS queue full, dropping retry to {message['to']}")
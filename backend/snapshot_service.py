@@ -0,0 +1,227 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class StockSnapshotService:
+    """Point-in-time stock-on-hand snapshots folded incrementally from stock_moves"""
+
+    # Moves committed late (slow transactions, clock skew) must not fall behind a snapshot boundary
+    SETTLE_SECONDS = 60
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def _delta_pipeline(start: Optional[str], end: str,
+                        product_id: Optional[str] = None,
+                        warehouse_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregation stages turning stock moves in (start, end] into per-location quantity deltas.
+        Legs mirror create_stock_move: receipts credit the destination, issues debit the source,
+        transfers and adjustments touch whichever side is set.
+        """
+        created_at = {"$lte": end}
+        if start:
+            created_at["$gt"] = start
+        match = {"created_at": created_at}
+        if product_id:
+            match["product_id"] = product_id
+
+        stages = [
+            {"$match": match},
+            {"$project": {
+                "product_id": 1,
+                "legs": [
+                    {
+                        "warehouse_id": "$from_warehouse_id",
+                        "bin_id": {"$ifNull": ["$from_bin_id", None]},
+                        "quantity": {"$multiply": ["$quantity", -1]},
+                        "applies": {"$and": [
+                            {"$in": ["$move_type", ["issue", "transfer", "adjustment"]]},
+                            {"$ne": [{"$ifNull": ["$from_warehouse_id", None]}, None]}
+                        ]}
+                    },
+                    {
+                        "warehouse_id": "$to_warehouse_id",
+                        "bin_id": {"$ifNull": ["$to_bin_id", None]},
+                        "quantity": "$quantity",
+                        "applies": {"$and": [
+                            {"$in": ["$move_type", ["receipt", "transfer", "adjustment"]]},
+                            {"$ne": [{"$ifNull": ["$to_warehouse_id", None]}, None]}
+                        ]}
+                    }
+                ]
+            }},
+            {"$unwind": "$legs"},
+            {"$match": {"legs.applies": True}},
+            {"$project": {
+                "_id": 0,
+                "product_id": 1,
+                "warehouse_id": "$legs.warehouse_id",
+                "bin_id": "$legs.bin_id",
+                "quantity": "$legs.quantity"
+            }}
+        ]
+        if warehouse_id:
+            stages.append({"$match": {"warehouse_id": warehouse_id}})
+        return stages
+
+    @staticmethod
+    def _fold_pipeline(start: Optional[str], end: str, base_snapshot_id: Optional[str],
+                       product_id: Optional[str] = None,
+                       warehouse_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Base snapshot balances + deltas since it, grouped per (product, warehouse, bin)"""
+        stages = StockSnapshotService._delta_pipeline(start, end, product_id, warehouse_id)
+
+        if base_snapshot_id:
+            base_match = {"snapshot_id": base_snapshot_id}
+            if product_id:
+                base_match["product_id"] = product_id
+            if warehouse_id:
+                base_match["warehouse_id"] = warehouse_id
+            stages.append({"$unionWith": {
+                "coll": "stock_snapshot_balances",
+                "pipeline": [
+                    {"$match": base_match},
+                    {"$project": {"_id": 0, "product_id": 1, "warehouse_id": 1, "bin_id": 1, "quantity": 1}}
+                ]
+            }})
+
+        stages += [
+            {"$group": {
+                "_id": {"product_id": "$product_id", "warehouse_id": "$warehouse_id", "bin_id": "$bin_id"},
+                "quantity": {"$sum": "$quantity"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "product_id": "$_id.product_id",
+                "warehouse_id": "$_id.warehouse_id",
+                "bin_id": "$_id.bin_id",
+                "quantity": 1
+            }}
+        ]
+        return stages
+
+    @staticmethod
+    async def _latest_snapshot(db: AsyncIOMotorDatabase, as_of: Optional[str] = None) -> Optional[Dict]:
+        query = {"as_of": {"$lte": as_of}} if as_of else {}
+        return await db.stock_snapshots.find_one(query, {"_id": 0}, sort=[("as_of", -1)])
+
+    @staticmethod
+    async def take_snapshot(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """
+        Fold the moves since the previous snapshot into a new one: previous balances are
+        unioned with the new deltas server-side and the result is written in batches
+        """
+        as_of = (datetime.now(timezone.utc) - timedelta(seconds=StockSnapshotService.SETTLE_SECONDS)).isoformat()
+        previous = await StockSnapshotService._latest_snapshot(db)
+        if previous and previous["as_of"] >= as_of:
+            return previous
+
+        snapshot_id = str(uuid.uuid4())
+        pipeline = StockSnapshotService._fold_pipeline(
+            previous["as_of"] if previous else None,
+            as_of,
+            previous["id"] if previous else None
+        )
+        pipeline.append({"$addFields": {"snapshot_id": snapshot_id}})
+
+        rows = 0
+        batch = []
+        async for balance in db.stock_moves.aggregate(pipeline, allowDiskUse=True, batchSize=StockSnapshotService.BATCH_SIZE):
+            if balance["quantity"] == 0:
+                continue
+            batch.append(balance)
+            if len(batch) >= StockSnapshotService.BATCH_SIZE:
+                await db.stock_snapshot_balances.insert_many(batch, ordered=False)
+                rows += len(batch)
+                batch = []
+        if batch:
+            await db.stock_snapshot_balances.insert_many(batch, ordered=False)
+            rows += len(batch)
+
+        # The run record is written last, so a half-built snapshot is never used as a base
+        snapshot = {
+            "id": snapshot_id,
+            "as_of": as_of,
+            "previous_snapshot_id": previous["id"] if previous else None,
+            "rows": rows,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.stock_snapshots.insert_one(dict(snapshot))
+        logger.info(f"Stock snapshot {snapshot_id} as of {as_of}: {snapshot['rows']} rows")
+        return snapshot
+
+    @staticmethod
+    async def balances_as_of(db: AsyncIOMotorDatabase, as_of: str,
+                             product_id: Optional[str] = None,
+                             warehouse_id: Optional[str] = None) -> Dict[str, Any]:
+        """Balances at `as_of`: nearest earlier snapshot plus only the moves after it"""
+        base = await StockSnapshotService._latest_snapshot(db, as_of)
+        pipeline = StockSnapshotService._fold_pipeline(
+            base["as_of"] if base else None,
+            as_of,
+            base["id"] if base else None,
+            product_id,
+            warehouse_id
+        )
+        balances = await db.stock_moves.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+        return {
+            "as_of": as_of,
+            "snapshot_id": base["id"] if base else None,
+            "snapshot_as_of": base["as_of"] if base else None,
+            "balances": [b for b in balances if b["quantity"] != 0]
+        }
+
+    @staticmethod
+    async def detect_drift(db: AsyncIOMotorDatabase,
+                           product_id: Optional[str] = None,
+                           warehouse_id: Optional[str] = None,
+                           tolerance: float = 1e-9) -> Dict[str, Any]:
+        """Compare inventory_items against balances rebuilt from stock_moves"""
+        as_of = datetime.now(timezone.utc).isoformat()
+        rebuilt = await StockSnapshotService.balances_as_of(db, as_of, product_id, warehouse_id)
+
+        query = {}
+        if product_id:
+            query["product_id"] = product_id
+        if warehouse_id:
+            query["warehouse_id"] = warehouse_id
+        expected = {
+            (b["product_id"], b["warehouse_id"], b["bin_id"]): b["quantity"]
+            for b in rebuilt["balances"]
+        }
+
+        drift = []
+        seen = set()
+        async for item in db.inventory_items.find(query, {"_id": 0}):
+            key = (item["product_id"], item["warehouse_id"], item.get("bin_id"))
+            seen.add(key)
+            expected_qty = expected.get(key, 0.0)
+            if abs(item.get("quantity", 0.0) - expected_qty) > tolerance:
+                drift.append({
+                    "product_id": key[0], "warehouse_id": key[1], "bin_id": key[2],
+                    "inventory_quantity": item.get("quantity", 0.0), "expected_quantity": expected_qty
+                })
+        for key, expected_qty in expected.items():
+            if key not in seen:
+                drift.append({
+                    "product_id": key[0], "warehouse_id": key[1], "bin_id": key[2],
+                    "inventory_quantity": None, "expected_quantity": expected_qty
+                })
+
+        return {"as_of": as_of, "snapshot_id": rebuilt["snapshot_id"], "drift": drift}
+
+    @staticmethod
+    async def run_periodically(db: AsyncIOMotorDatabase, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await StockSnapshotService.take_snapshot(db)
+            except Exception as e:
+                logger.error(f"Stock snapshot job failed: {e}")
@@ -1,9 +1,16 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Dict, Any, List, Optional
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import OperationFailure
 import httpx
+import asyncio
+import hashlib
+import hmac
 import logging
+import os
+import random
 from pydantic import BaseModel, HttpUrl
 import uuid
 import json
@@ -28,6 +35,75 @@ class WebhookEvent(BaseModel):
     timestamp: str
 
 
+class WebhookRoutingTable:
+    """
+    In-memory event type -> active subscriptions map, so fan-out is a dict lookup.
+    Kept current by a change stream on webhook_subscriptions where the deployment
+    supports one (replica set), otherwise by a periodic reload.
+    """
+    
+    def __init__(self, refresh_interval_seconds: float = 30.0):
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self._routes: Dict[str, List[Dict[str, Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.loaded = False
+    
+    async def load(self, db: AsyncIOMotorDatabase):
+        routes: Dict[str, List[Dict[str, Any]]] = {}
+        async for subscription in db.webhook_subscriptions.find(
+            {"is_active": True},
+            {"_id": 0, "id": 1, "url": 1, "events": 1, "secret": 1}
+        ):
+            for event in subscription.get("events", []):
+                routes.setdefault(event, []).append(subscription)
+        # Swapped in whole, so readers never see a half-built table
+        self._routes = routes
+        self.loaded = True
+    
+    def subscriptions_for(self, event_type: str) -> List[Dict[str, Any]]:
+        return self._routes.get(event_type, [])
+    
+    def start(self, db: AsyncIOMotorDatabase):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(db))
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _watch(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                async with db.webhook_subscriptions.watch() as stream:
+                    # Changes made before the stream opened are picked up by this reload
+                    await self.load(db)
+                    async for _ in stream:
+                        await self.load(db)
+            except OperationFailure as e:
+                if e.code == 40573:  # change streams need a replica set
+                    logger.info(f"Change streams unavailable, reloading webhook routes every {self.refresh_interval_seconds}s")
+                    await self._poll(db)
+                    return
+                logger.error(f"Webhook subscription change stream failed: {e}")
+            except Exception as e:
+                logger.error(f"Webhook subscription change stream failed: {e}")
+            await asyncio.sleep(self.refresh_interval_seconds)
+    
+    async def _poll(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            try:
+                await self.load(db)
+            except Exception as e:
+                logger.error(f"Webhook route reload failed: {e}")
+
+
+subscription_routes = WebhookRoutingTable(
+    refresh_interval_seconds=float(os.environ.get("WEBHOOK_ROUTES_REFRESH_SECONDS", "30"))
+)
+
+
 class WebhookService:
     """Manage webhook subscriptions and deliveries"""
     
@@ -65,66 +141,345 @@ class WebhookService:
         }
         
         await db.webhook_subscriptions.insert_one(subscription_data)
+        await subscription_routes.load(db)
         
+        subscription_data.pop("_id", None)
         return subscription_data
     
+    @staticmethod
+    async def unsubscribe(db: AsyncIOMotorDatabase, subscription_id: str) -> bool:
+        """Delete a webhook subscription; queued deliveries to it still go out"""
+        result = await db.webhook_subscriptions.delete_one({"id": subscription_id})
+        await subscription_routes.load(db)
+        return result.deleted_count > 0
+    
+    @staticmethod
+    def sign(payload: bytes, secret: str) -> str:
+        """HMAC-SHA256 over the exact request body"""
+        return hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+    
     @staticmethod
     async def trigger_event(
         db: AsyncIOMotorDatabase,
         event_type: str,
         data: Dict[str, Any],
-        background_tasks: BackgroundTasks
-    ):
-        """Trigger webhook event to all subscribers"""
-        # Get active subscriptions for this event
-        subscriptions = await db.webhook_subscriptions.find({
-            "is_active": True,
-            "events": event_type
-        }).to_list(100)
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> int:
+        """
+        Queue a webhook event for all subscribers in webhook_deliveries, where
+        WebhookDispatcher picks it up. Deliveries survive restarts; background_tasks
+        is no longer needed and only kept for existing callers.
+        Returns the number of deliveries queued.
+        """
+        # Active subscriptions for this event, from the routing table once it is loaded
+        if subscription_routes.loaded:
+            subscriptions = subscription_routes.subscriptions_for(event_type)
+        else:
+            subscriptions = await db.webhook_subscriptions.find({
+                "is_active": True,
+                "events": event_type
+            }, {"_id": 0}).to_list(None)
         
         event = {
             "event_type": event_type,
             "data": data,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
+        # Serialized once: the stored payload is exactly what is signed and sent
+        payload = json.dumps(event, default=str)
         
-        # Deliver to all subscribers (async in background)
+        now = datetime.now(timezone.utc)
+        deliveries = []
         for subscription in subscriptions:
-            background_tasks.add_task(
-                WebhookService._deliver_webhook,
-                subscription["url"],
-                event,
-                subscription.get("secret")
+            secret = subscription.get("secret")
+            deliveries.append({
+                "id": str(uuid.uuid4()),
+                "subscription_id": subscription["id"],
+                "url": subscription["url"],
+                "event_type": event_type,
+                "payload": payload,
+                "signature": WebhookService.sign(payload.encode(), secret) if secret else None,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "lease_until": None,
+                "last_error": None,
+                "last_status_code": None,
+                "created_at": now.isoformat()
+            })
+        
+        if deliveries:
+            await db.webhook_deliveries.insert_many(deliveries)
+        return len(deliveries)
+
+
+class WebhookDispatcher:
+    """
+    Background worker delivering queued webhook_deliveries over one pooled HTTP client,
+    with per-endpoint concurrency limits, exponential backoff with jitter and dead-lettering.
+    Deliveries are claimed with a lease and a claim token, so ones in flight when the
+    process stops are retried once the lease runs out, and a stale worker cannot
+    overwrite a row that has been claimed again.
+    """
+    
+    # 4xx responses that are worth retrying; any other 4xx is dead-lettered immediately
+    RETRYABLE_STATUS_CODES = {408, 425, 429}
+    
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        max_in_flight: int = 50,
+        per_endpoint_concurrency: int = 4,
+        max_attempts: int = 8,
+        base_backoff_seconds: float = 2.0,
+        max_backoff_seconds: float = 3600.0,
+        lease_seconds: float = 60.0,
+        poll_interval_seconds: float = 1.0,
+        timeout: float = 10.0,
+        delivered_retention_days: int = 7,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.db = db
+        self.max_in_flight = max_in_flight
+        self.per_endpoint_concurrency = per_endpoint_concurrency
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.timeout = timeout
+        self.delivered_retention_days = delivered_retention_days
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        # url -> deliveries currently claimed by this worker
+        self._in_flight_by_url: Dict[str, int] = {}
+        self._in_flight: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.delivered_total = 0
+        self.failed_attempts_total = 0
+        self.dead_lettered_total = 0
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=20),
+                transport=self._transport
             )
+        return self._client
     
-    @staticmethod
-    async def _deliver_webhook(url: str, event: Dict, secret: Optional[str] = None):
-        """Deliver webhook to subscriber"""
-        headers = {"Content-Type": "application/json"}
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "delivered_total": self.delivered_total,
+            "failed_attempts_total": self.failed_attempts_total,
+            "dead_lettered_total": self.dead_lettered_total
+        }
+    
+    def wake(self):
+        """Check the queue now instead of at the next poll"""
+        self._wakeup.set()
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self, drain_timeout: float = 5.0):
+        """Let in-flight deliveries finish, then stop; unfinished ones are retried after their lease"""
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        self._task = None
+        if self._in_flight:
+            done, pending = await asyncio.wait(list(self._in_flight), timeout=drain_timeout)
+            for task in pending:
+                task.cancel()
         
-        if secret:
-            # Add signature for verification
-            import hmac
-            import hashlib
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self._claim(self.max_in_flight - len(self._in_flight))
+            except Exception as e:
+                logger.error(f"Webhook queue poll failed: {e}")
+                claimed = []
+            
+            for delivery in claimed:
+                task = asyncio.create_task(self._deliver(delivery))
+                self._in_flight.add(task)
+                task.add_done_callback(self._delivery_done)
             
-            payload = json.dumps(event)
-            signature = hmac.new(
-                secret.encode(),
-                payload.encode(),
-                hashlib.sha256
-            ).hexdigest()
-            headers["X-Webhook-Signature"] = signature
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+    
+    def _delivery_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        # A slot is free again
+        self._wakeup.set()
+    
+    def _saturated_urls(self) -> List[str]:
+        return [url for url, count in self._in_flight_by_url.items() if count >= self.per_endpoint_concurrency]
+    
+    async def _claim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` due deliveries (pending and due, or delivering with an expired lease).
+        Endpoints already at their concurrency limit are skipped, so a slow or failing URL
+        cannot take the slots of healthy ones. Each claim gets a fresh token; only the
+        holder of the current token may update the row afterwards.
+        """
+        claimed = []
+        for _ in range(max(limit, 0)):
+            now = datetime.now(timezone.utc)
+            query = {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "delivering", "lease_until": {"$lte": now}}
+            ]}
+            saturated = self._saturated_urls()
+            if saturated:
+                query["url"] = {"$nin": saturated}
+            
+            delivery = await self.db.webhook_deliveries.find_one_and_update(
+                query,
+                {"$set": {
+                    "status": "delivering",
+                    "claim_token": str(uuid.uuid4()),
+                    "lease_until": now + timedelta(seconds=self.lease_seconds)
+                }},
+                sort=[("next_attempt_at", ASCENDING)],
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if not delivery:
+                break
+            self._in_flight_by_url[delivery["url"]] = self._in_flight_by_url.get(delivery["url"], 0) + 1
+            claimed.append(delivery)
+        return claimed
+    
+    @staticmethod
+    def _claim_filter(delivery: Dict[str, Any]) -> Dict[str, Any]:
+        """Matches the row only while this worker's claim on it is still current"""
+        return {"id": delivery["id"], "status": "delivering", "claim_token": delivery["claim_token"]}
+    
+    async def _deliver(self, delivery: Dict[str, Any]):
+        try:
+            await self._attempt(delivery)
+        finally:
+            remaining = self._in_flight_by_url.get(delivery["url"], 1) - 1
+            if remaining > 0:
+                self._in_flight_by_url[delivery["url"]] = remaining
+            else:
+                self._in_flight_by_url.pop(delivery["url"], None)
+    
+    async def _attempt(self, delivery: Dict[str, Any]):
+        # The lease runs from the moment the request goes out; a lost claim means another worker has the row
+        renewed = await self.db.webhook_deliveries.update_one(
+            self._claim_filter(delivery),
+            {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+        )
+        if renewed.matched_count == 0:
+            logger.warning(f"Webhook {delivery['id']} was claimed again elsewhere, skipping")
+            return
         
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Event": delivery["event_type"],
+            "X-Webhook-Delivery": delivery["id"]
+        }
+        if delivery.get("signature"):
+            headers["X-Webhook-Signature"] = delivery["signature"]
+        
+        status_code = None
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(url, json=event, headers=headers)
-                
-                if response.status_code >= 200 and response.status_code < 300:
-                    logger.info(f"Webhook delivered to {url}: {response.status_code}")
-                else:
-                    logger.warning(f"Webhook failed to {url}: {response.status_code}")
+            response = await self._get_client().post(
+                delivery["url"],
+                content=delivery["payload"].encode(),
+                headers=headers
+            )
+            status_code = response.status_code
+            if 200 <= status_code < 300:
+                await self._mark_delivered(delivery, status_code)
+                return
+            error = f"HTTP {status_code}"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        
+        try:
+            await self._record_failure(delivery, error, status_code)
         except Exception as e:
-            logger.error(f"Webhook delivery error to {url}: {e}")
+            # The lease expires and the delivery is claimed again
+            logger.error(f"Could not record webhook failure for {delivery['id']}: {e}")
+    
+    async def _mark_delivered(self, delivery: Dict[str, Any], status_code: int):
+        now = datetime.now(timezone.utc)
+        result = await self.db.webhook_deliveries.update_one(self._claim_filter(delivery), {
+            "$set": {
+                "status": "delivered",
+                "last_status_code": status_code,
+                "delivered_at": now.isoformat(),
+                "lease_until": None,
+                # TTL index removes delivered rows after the retention period
+                "purge_at": now + timedelta(days=self.delivered_retention_days)
+            },
+            "$inc": {"attempts": 1}
+        })
+        if result.matched_count == 0:
+            logger.warning(f"Webhook {delivery['id']} delivered after its claim was lost")
+            return
+        self.delivered_total += 1
+        logger.info(f"Webhook {delivery['event_type']} delivered to {delivery['url']}: {status_code}")
+    
+    async def _record_failure(self, delivery: Dict[str, Any], error: str, status_code: Optional[int]):
+        attempts = delivery["attempts"] + 1
+        retryable = status_code is None or status_code >= 500 or status_code in self.RETRYABLE_STATUS_CODES
+        self.failed_attempts_total += 1
+        
+        if not retryable or attempts >= self.max_attempts:
+            # Removed under the claim first, so a stale worker cannot dead-letter a row it no longer owns
+            removed = await self.db.webhook_deliveries.find_one_and_delete(self._claim_filter(delivery), projection={"_id": 0})
+            if not removed:
+                logger.warning(f"Webhook {delivery['id']} failed after its claim was lost")
+                return
+            dead_letter = {
+                **removed,
+                "status": "dead",
+                "attempts": attempts,
+                "last_error": error,
+                "last_status_code": status_code,
+                "lease_until": None,
+                "dead_lettered_at": datetime.now(timezone.utc).isoformat()
+            }
+            await self.db.webhook_dead_letters.insert_one(dead_letter)
+            self.dead_lettered_total += 1
+            logger.error(f"Webhook {delivery['id']} to {delivery['url']} dead-lettered after {attempts} attempts: {error}")
+            return
+        
+        # Exponential backoff with jitter
+        delay = min(
+            self.base_backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5),
+            self.max_backoff_seconds
+        )
+        result = await self.db.webhook_deliveries.update_one(self._claim_filter(delivery), {"$set": {
+            "status": "pending",
+            "attempts": attempts,
+            "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            "lease_until": None,
+            "claim_token": None,
+            "last_error": error,
+            "last_status_code": status_code
+        }})
+        if result.matched_count == 0:
+            logger.warning(f"Webhook {delivery['id']} failed after its claim was lost")
+            return
+        logger.warning(f"Webhook to {delivery['url']} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
 
 
 class RESTAPIDocumentation:
@@ -0,0 +1,146 @@
+import requests
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StockMoveBenchmark:
+    """Measures stock move posting throughput and latency against a running API"""
+
+    def __init__(self, base_url, email, password):
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.session = requests.Session()
+        self.product_id = None
+        self.warehouse_ids = []
+
+    def login(self):
+        response = self.session.post(f"{self.base_url}/auth/login", json={
+            "email": self.email,
+            "password": self.password
+        })
+        response.raise_for_status()
+        token = response.json()["session_token"]
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def setup(self):
+        """Create a dedicated product and two warehouses so runs do not interfere"""
+        suffix = datetime.now().strftime('%H%M%S%f')
+        response = self.session.post(f"{self.base_url}/products", json={
+            "code": f"BENCH-{suffix}",
+            "name": f"Benchmark Product {suffix}"
+        })
+        response.raise_for_status()
+        self.product_id = response.json()["id"]
+
+        for index in range(2):
+            response = self.session.post(f"{self.base_url}/warehouses", json={
+                "code": f"BENCH-WH{index}-{suffix}",
+                "name": f"Benchmark Warehouse {index}"
+            })
+            response.raise_for_status()
+            self.warehouse_ids.append(response.json()["id"])
+
+    def post_move(self, move_type):
+        payload = {"product_id": self.product_id, "move_type": move_type, "quantity": 1}
+        if move_type == "receipt":
+            payload["to_warehouse_id"] = self.warehouse_ids[0]
+        else:
+            payload["from_warehouse_id"] = self.warehouse_ids[0]
+            payload["to_warehouse_id"] = self.warehouse_ids[1]
+
+        started = time.perf_counter()
+        response = self.session.post(f"{self.base_url}/stock-moves", json=payload)
+        elapsed = time.perf_counter() - started
+        return response.status_code == 200, elapsed
+
+    def run(self, move_type, count, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: self.post_move(move_type), range(count)))
+        wall_time = time.perf_counter() - started
+
+        latencies = sorted(elapsed for ok, elapsed in results if ok)
+        failures = sum(1 for ok, _ in results if not ok)
+        return {
+            "move_type": move_type,
+            "count": count,
+            "failures": failures,
+            "throughput": len(latencies) / wall_time if wall_time else 0.0,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+        }
+
+    def expected_quantities(self, receipts, transfers):
+        response = self.session.get(f"{self.base_url}/inventory", params={"product_id": self.product_id})
+        response.raise_for_status()
+        quantities = {item["warehouse_id"]: item["quantity"] for item in response.json()}
+        return (
+            quantities.get(self.warehouse_ids[0], 0) == receipts - transfers and
+            quantities.get(self.warehouse_ids[1], 0) == transfers
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transactional stock move posting")
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--budget-rps", type=float, default=100.0,
+                        help="minimum acceptable receipts per second")
+    parser.add_argument("--label", default="transactions",
+                        help="mode under test, e.g. 'baseline' against an API started with MONGO_TRANSACTIONS=false")
+    parser.add_argument("--output", help="also write the results as JSON to this path, to attach to a review")
+    args = parser.parse_args()
+
+    bench = StockMoveBenchmark(args.base_url, args.email, args.password)
+    bench.login()
+    bench.setup()
+
+    receipts = bench.run("receipt", args.count, args.concurrency)
+    transfers = bench.run("transfer", args.count // 2, args.concurrency)
+
+    print("=" * 80)
+    print(f"STOCK MOVE POSTING BENCHMARK ({args.label})")
+    print("=" * 80)
+    for result in (receipts, transfers):
+        print(f"{result['move_type']:>10}: {result['throughput']:8.1f} moves/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+              f"failures {result['failures']}")
+
+    consistent = bench.expected_quantities(
+        receipts["count"] - receipts["failures"],
+        transfers["count"] - transfers["failures"]
+    )
+    print(f"Inventory consistent with posted moves: {'yes' if consistent else 'NO'}")
+
+    within_budget = receipts["throughput"] >= args.budget_rps
+    print(f"Receipt throughput budget ({args.budget_rps:.0f}/s): {'met' if within_budget else 'MISSED'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "label": args.label,
+                "base_url": args.base_url,
+                "run_at": datetime.now().isoformat(),
+                "count": args.count,
+                "concurrency": args.concurrency,
+                "budget_rps": args.budget_rps,
+                "results": [receipts, transfers],
+                "inventory_consistent": consistent,
+                "within_budget": within_budget
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    return 0 if consistent and within_budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Backend modules import each other by bare name (as uvicorn runs them from backend/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# server.py reads these at import time; Motor connects lazily, so no database is needed for unit tests
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
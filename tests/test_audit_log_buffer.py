@@ -0,0 +1,54 @@
+import asyncio
+
+from audit_service import AuditLogBuffer
+
+
+class FakeAuditLogs:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def insert_many(self, records, ordered=True):
+        self.calls.append(list(records))
+        if self.fail:
+            raise ConnectionError("database unavailable")
+
+
+class FakeDB:
+    def __init__(self, fail=False):
+        self.audit_logs = FakeAuditLogs(fail)
+
+
+def test_add_hands_a_full_buffer_to_the_background_flusher():
+    db = FakeDB()
+    buffer = AuditLogBuffer(db, flush_size=2, flush_interval_seconds=60)
+
+    async def run():
+        buffer.start()
+        await buffer.add({"id": "1"})
+        await buffer.add({"id": "2"})
+        # add() returned without writing; the flusher picks the records up on its next turn
+        assert db.audit_logs.calls == []
+        await asyncio.sleep(0.05)
+        assert db.audit_logs.calls == [[{"id": "1"}, {"id": "2"}]]
+        await buffer.stop()
+
+    asyncio.run(run())
+
+
+def test_failed_flush_waits_for_the_interval_before_retrying():
+    db = FakeDB(fail=True)
+    buffer = AuditLogBuffer(db, flush_size=1, flush_interval_seconds=0.2)
+
+    async def run():
+        buffer.start()
+        await buffer.add({"id": "1"})
+        await asyncio.sleep(0.05)
+        for n in range(2, 20):
+            await buffer.add({"id": str(n)})
+        await asyncio.sleep(0.05)
+        assert len(db.audit_logs.calls) == 1
+        assert buffer.queue_depth == 19
+        await buffer.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+from auth_service import OAuthSessionClient
+
+SESSION_URL = "http://auth.local/session-data"
+SESSION_DATA = {"id": "u1", "email": "user@example.com", "name": "User", "session_token": "tok"}
+
+
+def run_client(handler, calls, session_ids, **options):
+    def record(request):
+        calls.append(request)
+        return handler(request)
+
+    client = OAuthSessionClient(SESSION_URL, transport=httpx.MockTransport(record), **options)
+
+    async def run():
+        try:
+            return [await client.get_session_data(session_id) for session_id in session_ids]
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+
+def test_5xx_is_retried_then_succeeds():
+    calls = []
+    responses = iter([httpx.Response(502), httpx.Response(503), httpx.Response(200, json=SESSION_DATA)])
+
+    result = run_client(lambda request: next(responses), calls, ["sess-1"], max_retries=2)
+
+    assert result == [SESSION_DATA]
+    assert len(calls) == 3
+    assert all(request.headers["X-Session-ID"] == "sess-1" for request in calls)
+
+
+def test_5xx_gives_up_after_max_retries():
+    calls = []
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run_client(lambda request: httpx.Response(500), calls, ["sess-1"], max_retries=1)
+
+    assert len(calls) == 2
+
+
+def test_4xx_is_raised_immediately():
+    calls = []
+
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        run_client(lambda request: httpx.Response(401), calls, ["sess-1"], max_retries=3)
+
+    assert error.value.response.status_code == 401
+    assert len(calls) == 1
+
+
+def test_cache_hit_makes_no_second_request():
+    calls = []
+
+    result = run_client(lambda request: httpx.Response(200, json=SESSION_DATA), calls, ["sess-1", "sess-1"])
+
+    assert result == [SESSION_DATA, SESSION_DATA]
+    assert len(calls) == 1
+
+
+def test_expired_cache_entry_is_fetched_again():
+    calls = []
+
+    run_client(lambda request: httpx.Response(200, json=SESSION_DATA), calls, ["sess-1", "sess-1"],
+               cache_ttl_seconds=0)
+
+    assert len(calls) == 2
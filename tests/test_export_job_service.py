@@ -0,0 +1,26 @@
+import pytest
+
+from export_job_service import parse_range_header
+
+
+def test_missing_or_malformed_range_serves_whole_file():
+    assert parse_range_header(None, 10) is None
+    assert parse_range_header("bytes=0-1,4-5", 10) is None
+    assert parse_range_header("items=0-1", 10) is None
+
+
+def test_start_after_end_is_ignored():
+    assert parse_range_header("bytes=5-2", 10) is None
+
+
+def test_ranges_are_clamped_to_the_file():
+    assert parse_range_header("bytes=2-", 10) == (2, 9)
+    assert parse_range_header("bytes=0-99", 10) == (0, 9)
+    assert parse_range_header("bytes=-3", 10) == (7, 9)
+
+
+def test_start_past_end_of_file_is_unsatisfiable():
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=10-12", 10)
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=-5", 0)
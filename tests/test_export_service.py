@@ -0,0 +1,81 @@
+import asyncio
+import codecs
+import csv
+import io
+
+from openpyxl import load_workbook
+
+from export_service import ExportService
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """find() and the key-union aggregate of collect_fieldnames, over documents without filters"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor([{k: v for k, v in doc.items() if k != "_id"} for doc in self.docs])
+
+    def aggregate(self, pipeline, **kwargs):
+        positions = {}
+        for doc in self.docs:
+            for position, key in enumerate(k for k in doc if k != "_id"):
+                positions[key] = min(position, positions.get(key, position))
+        keys = sorted(positions, key=lambda key: (positions[key], key))
+        return FakeCursor([{"_id": key, "position": positions[key]} for key in keys])
+
+
+def export_csv(docs):
+    db = {"products": FakeCollection(docs)}
+    data = asyncio.run(ExportService.export_to_csv(db, "products"))
+    assert data.startswith(codecs.BOM_UTF8)
+    return list(csv.reader(io.StringIO(data[len(codecs.BOM_UTF8):].decode("utf-8"))))
+
+
+def test_csv_keeps_fields_that_first_appear_after_the_first_batch():
+    docs = [{"_id": n, "id": str(n), "code": f"C{n}"} for n in range(ExportService.EXPORT_BATCH_SIZE)]
+    docs.append({"_id": "late", "id": "late", "code": "L", "is_active": True})
+
+    rows = export_csv(docs)
+
+    assert rows[0] == ["id", "code", "is_active"]
+    assert rows[-1] == ["late", "L", "True"]
+    assert len(rows) == len(docs) + 1
+    assert sum(1 for row in rows if len(row) != 3) == 0
+
+
+def test_csv_without_documents():
+    db = {"products": FakeCollection([])}
+    assert asyncio.run(ExportService.export_to_csv(db, "products")) == b"No data found"
+
+
+def test_excel_keeps_fields_that_first_appear_after_the_first_batch(tmp_path):
+    docs = [{"_id": n, "id": str(n), "code": f"C{n}"} for n in range(ExportService.EXPORT_BATCH_SIZE)]
+    docs.append({"_id": "late", "id": "late", "code": "L", "is_active": True})
+    path = str(tmp_path / "products.xlsx")
+
+    written = asyncio.run(ExportService.write_excel({"products": FakeCollection(docs)}, "products", None, path))
+
+    rows = list(load_workbook(path, read_only=True).worksheets[0].iter_rows(values_only=True))
+    assert written == len(docs)
+    assert rows[0] == ("id", "code", "is_active")
+    assert rows[-1] == ("late", "L", True)
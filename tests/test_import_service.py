@@ -0,0 +1,64 @@
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+from export_service import ImportService
+
+
+class FakeBulkResult:
+    def __init__(self, matched_count, upserted_count):
+        self.matched_count = matched_count
+        self.upserted_count = upserted_count
+        self.inserted_count = 0
+
+
+class FakeCollection:
+    """Records each bulk_write; ids listed in `failing` come back as duplicate key write errors"""
+
+    def __init__(self, existing=(), failing=()):
+        self.existing = set(existing)
+        self.failing = set(failing)
+        self.batches = []
+
+    async def bulk_write(self, operations, ordered=True):
+        assert ordered is False
+        ids = [op._filter["id"] for op in operations]
+        self.batches.append(ids)
+        errors = [
+            {"index": index, "code": 11000, "errmsg": "E11000 duplicate key"}
+            for index, record_id in enumerate(ids) if record_id in self.failing
+        ]
+        written = [record_id for record_id in ids if record_id not in self.failing]
+        matched = sum(1 for record_id in written if record_id in self.existing)
+        if errors:
+            raise BulkWriteError({
+                "nMatched": matched, "nUpserted": len(written) - matched, "nInserted": 0, "writeErrors": errors
+            })
+        return FakeBulkResult(matched, len(written) - matched)
+
+
+def test_update_mode_upserts_in_batches():
+    collection = FakeCollection(existing={"1", "2"})
+    records = [{"id": str(n), "code": f"C{n}"} for n in range(1, 6)]
+
+    result = asyncio.run(ImportService._bulk_upsert({"products": collection}, "products", records, batch_size=2))
+
+    assert collection.batches == [["1", "2"], ["3", "4"], ["5"]]
+    assert result == {
+        "mode": "update", "updated": 2, "inserted": 3, "skipped": 0, "batches": 3, "errors": []
+    }
+
+
+def test_update_mode_reports_failures_per_batch_and_skips_records_without_id():
+    collection = FakeCollection(failing={"2", "3"})
+    records = [{"id": "1"}, {"code": "no-id"}, {"id": "2"}, {"id": "3"}, {"id": "4"}]
+
+    result = asyncio.run(ImportService._bulk_upsert({"products": collection}, "products", records, batch_size=2))
+
+    assert result["skipped"] == 1
+    assert result["inserted"] == 2
+    assert result["batches"] == 2
+    assert result["errors"] == [
+        {"batch": 1, "failed": 1, "records": [{"id": "2", "code": 11000, "message": "E11000 duplicate key"}]},
+        {"batch": 2, "failed": 1, "records": [{"id": "3", "code": 11000, "message": "E11000 duplicate key"}]}
+    ]
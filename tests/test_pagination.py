@@ -0,0 +1,18 @@
+from server import build_projection
+
+
+def test_fields_never_project_the_object_id():
+    assert build_projection("_id,_id.x,name", "created_at") == {"_id": 0, "id": 1, "created_at": 1, "name": 1}
+
+
+def test_colliding_paths_keep_only_the_parent():
+    projection = build_projection("a.b,a,c.d,id.x,created_at.y", "created_at")
+
+    assert projection == {"_id": 0, "id": 1, "created_at": 1, "a": 1, "c.d": 1}
+
+
+def test_operators_empty_segments_and_excluded_fields_are_skipped():
+    projection = build_projection("$where,p..q,x.,password_hash,password_hash.salt,,name", "created_at",
+                                  exclude=("password_hash",))
+
+    assert projection == {"_id": 0, "id": 1, "created_at": 1, "name": 1}
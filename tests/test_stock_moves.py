@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import server
+from server import StockMove, admit_stock_moves, explain_warehouse_shortfall, insufficient_stock_detail
+
+KEY = ("p1", "w1", None)
+
+
+def issue(quantity):
+    return StockMove(product_id="p1", move_type="issue", quantity=quantity, from_warehouse_id="w1")
+
+
+def receipt(quantity):
+    return StockMove(product_id="p1", move_type="receipt", quantity=quantity, to_warehouse_id="w1")
+
+
+def test_lines_are_admitted_in_order_until_the_row_runs_out():
+    moves = [issue(5), issue(5), issue(5)]
+
+    admitted, shortfall_by_line = admit_stock_moves(moves, {KEY: 10.0})
+
+    assert admitted == moves[:2]
+    assert list(shortfall_by_line) == [moves[2].id]
+    assert shortfall_by_line[moves[2].id]["requested"] == 5
+
+
+def test_credits_from_earlier_lines_count_towards_later_debits():
+    moves = [issue(5), receipt(5), issue(5), issue(1)]
+
+    admitted, shortfall_by_line = admit_stock_moves(moves, {})
+
+    assert admitted == moves[1:3]
+    assert set(shortfall_by_line) == {moves[0].id, moves[3].id}
+
+
+def test_rejected_transfer_does_not_credit_its_destination():
+    transfer = StockMove(product_id="p1", move_type="transfer", quantity=5,
+                         from_warehouse_id="w1", to_warehouse_id="w2")
+    onward = StockMove(product_id="p1", move_type="issue", quantity=5, from_warehouse_id="w2")
+
+    admitted, shortfall_by_line = admit_stock_moves([transfer, onward], {})
+
+    assert admitted == []
+    assert set(shortfall_by_line) == {transfer.id, onward.id}
+
+
+class FakeAggregate:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows
+
+
+def binned_inventory(monkeypatch, quantity):
+    rows = [{"_id": None, "quantity": quantity}] if quantity is not None else []
+    collection = SimpleNamespace(aggregate=lambda pipeline, session=None: FakeAggregate(rows))
+    monkeypatch.setattr(server, "db", SimpleNamespace(inventory_items=collection))
+
+
+def test_warehouse_level_shortfall_points_at_binned_stock(monkeypatch):
+    binned_inventory(monkeypatch, 12.0)
+
+    detail = asyncio.run(explain_warehouse_shortfall(insufficient_stock_detail("p1", "w1", None, 5)))
+
+    assert detail["message"] == "Stock in warehouse w1 is held in bins; specify the bin to take it from"
+    assert detail["binned_quantity"] == 12.0
+
+
+def test_warehouse_level_shortfall_without_binned_stock_is_unchanged(monkeypatch):
+    binned_inventory(monkeypatch, None)
+
+    detail = asyncio.run(explain_warehouse_shortfall(insufficient_stock_detail("p1", "w1", None, 5)))
+
+    assert detail["message"] == "Insufficient stock in warehouse w1"
+    assert "binned_quantity" not in detail
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+
+import httpx
+
+from webhook_service import WebhookDispatcher, WebhookService
+
+
+class FakeResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the dispatcher's per-delivery writes"""
+
+    def __init__(self):
+        self.docs = []
+        self.claim_queries = []
+
+    @staticmethod
+    def _matches(doc, query):
+        return all(doc.get(key) == value for key, value in query.items())
+
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(update.get("$set", {}))
+                for key, value in update.get("$inc", {}).items():
+                    doc[key] = doc.get(key, 0) + value
+                return FakeResult(1)
+        return FakeResult(0)
+
+    async def find_one_and_delete(self, query, projection=None):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                self.docs.remove(doc)
+                return dict(doc)
+        return None
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.claim_queries.append(query)
+        return None
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+
+class FakeDB:
+    def __init__(self):
+        self.webhook_deliveries = FakeCollection()
+        self.webhook_dead_letters = FakeCollection()
+
+
+SECRET = "s3cret"
+URL = "http://subscriber.local/hooks"
+
+
+def make_delivery(db, attempts=0, claim_token="token-1"):
+    payload = json.dumps({"event_type": "inventory.low_stock", "data": {"product_id": "p1"}})
+    delivery = {
+        "id": "d1",
+        "subscription_id": "s1",
+        "url": URL,
+        "event_type": "inventory.low_stock",
+        "payload": payload,
+        "signature": WebhookService.sign(payload.encode(), SECRET),
+        "status": "delivering",
+        "claim_token": "token-1",
+        "attempts": attempts,
+        "next_attempt_at": datetime.now(timezone.utc),
+        "lease_until": datetime.now(timezone.utc),
+        "last_error": None,
+        "last_status_code": None,
+    }
+    db.webhook_deliveries.docs.append(dict(delivery))
+    return dict(delivery, claim_token=claim_token)
+
+
+def deliver(db, delivery, handler, **options):
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    dispatcher = WebhookDispatcher(db, transport=httpx.MockTransport(record), **options)
+
+    async def run():
+        try:
+            await dispatcher._deliver(delivery)
+        finally:
+            await dispatcher.stop()
+            if dispatcher._client is not None:
+                await dispatcher._client.aclose()
+
+    asyncio.run(run())
+    return dispatcher, requests
+
+
+def test_2xx_marks_delivered_and_signs_sent_bytes():
+    db = FakeDB()
+    delivery = make_delivery(db)
+
+    dispatcher, requests = deliver(db, delivery, lambda request: httpx.Response(204))
+
+    assert len(requests) == 1
+    body = requests[0].content
+    assert body == delivery["payload"].encode()
+    expected = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    assert requests[0].headers["X-Webhook-Signature"] == expected
+
+    row = db.webhook_deliveries.docs[0]
+    assert row["status"] == "delivered"
+    assert row["attempts"] == 1
+    assert row["last_status_code"] == 204
+    assert dispatcher.delivered_total == 1
+    assert dispatcher._in_flight_by_url == {}
+
+
+def test_5xx_is_rescheduled_with_backoff():
+    db = FakeDB()
+    delivery = make_delivery(db)
+    before = datetime.now(timezone.utc)
+
+    deliver(db, delivery, lambda request: httpx.Response(503), base_backoff_seconds=10)
+
+    row = db.webhook_deliveries.docs[0]
+    assert row["status"] == "pending"
+    assert row["attempts"] == 1
+    assert row["last_status_code"] == 503
+    assert row["claim_token"] is None
+    # 10s base delay with 0.5-1.5 jitter
+    delay = (row["next_attempt_at"] - before).total_seconds()
+    assert 4 <= delay <= 16
+    assert db.webhook_dead_letters.docs == []
+
+
+def test_transport_error_is_rescheduled():
+    db = FakeDB()
+    delivery = make_delivery(db)
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    deliver(db, delivery, refuse)
+
+    row = db.webhook_deliveries.docs[0]
+    assert row["status"] == "pending"
+    assert row["last_status_code"] is None
+    assert "ConnectError" in row["last_error"]
+
+
+def test_4xx_is_dead_lettered():
+    db = FakeDB()
+    delivery = make_delivery(db)
+
+    dispatcher, _ = deliver(db, delivery, lambda request: httpx.Response(404))
+
+    assert db.webhook_deliveries.docs == []
+    dead = db.webhook_dead_letters.docs[0]
+    assert dead["id"] == "d1"
+    assert dead["status"] == "dead"
+    assert dead["last_status_code"] == 404
+    assert dispatcher.dead_lettered_total == 1
+
+
+def test_429_is_retried_not_dead_lettered():
+    db = FakeDB()
+    delivery = make_delivery(db)
+
+    deliver(db, delivery, lambda request: httpx.Response(429))
+
+    assert db.webhook_deliveries.docs[0]["status"] == "pending"
+    assert db.webhook_dead_letters.docs == []
+
+
+def test_max_attempts_dead_letters_retryable_failure():
+    db = FakeDB()
+    delivery = make_delivery(db, attempts=2)
+
+    deliver(db, delivery, lambda request: httpx.Response(500), max_attempts=3)
+
+    assert db.webhook_deliveries.docs == []
+    dead = db.webhook_dead_letters.docs[0]
+    assert dead["attempts"] == 3
+    assert dead["last_status_code"] == 500
+
+
+def test_lost_claim_sends_nothing_and_leaves_row_alone():
+    db = FakeDB()
+    delivery = make_delivery(db, claim_token="stale-token")
+
+    _, requests = deliver(db, delivery, lambda request: httpx.Response(200))
+
+    assert requests == []
+    row = db.webhook_deliveries.docs[0]
+    assert row["status"] == "delivering"
+    assert row["claim_token"] == "token-1"
+    assert row["attempts"] == 0
+
+
+def test_claim_skips_endpoints_at_capacity():
+    db = FakeDB()
+    dispatcher = WebhookDispatcher(db, per_endpoint_concurrency=2)
+    dispatcher._in_flight_by_url = {URL: 2, "http://other.local/hooks": 1}
+
+    assert asyncio.run(dispatcher._claim(5)) == []
+    assert db.webhook_deliveries.claim_queries[0]["url"] == {"$nin": [URL]}